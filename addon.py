@@ -0,0 +1,153 @@
+import bpy
+from bpy.props import BoolProperty, IntProperty
+from bpy.types import AddonPreferences
+from bpy.app.handlers import persistent
+
+from . import blender_decorator, menu, shapekey, unity
+from .blender_decorator import register_class
+
+@register_class
+class JToolsAddonPreferences(AddonPreferences):
+    bl_idname = __package__
+
+    warn_shapekey_edit: BoolProperty(
+        name='Warn on editing shape key',
+        default=False,
+        description='Show a popup warning when entering edit mode on a mesh shape key')
+
+    clip_cache_entries: IntProperty(
+        name='Cached clips',
+        default=64,
+        min=0,
+        soft_max=1024,
+        description='Number of parsed Unity animation clips kept in memory',
+        update=lambda self, context: configure_clip_cache())
+
+    clip_cache_use_disk: BoolProperty(
+        name='Disk cache',
+        default=True,
+        description='Also cache parsed Unity animation clips on disk, across Blender sessions',
+        update=lambda self, context: configure_clip_cache())
+
+    clip_cache_disk_size: IntProperty(
+        name='Disk cache size (MB)',
+        default=256,
+        min=1,
+        soft_max=4096,
+        description='Maximum size of the on-disk Unity animation clip cache',
+        update=lambda self, context: configure_clip_cache())
+
+    shape_key_cache_size: IntProperty(
+        name='Shape key cache size (MB)',
+        default=256,
+        min=0,
+        soft_max=4096,
+        description='Memory for remembering the vertices moved by each shape key, so that reports do not read shape keys again',
+        update=lambda self, context: configure_shape_key_cache())
+
+    def draw(self, context):
+        self.layout.prop(self, 'warn_shapekey_edit')
+
+        box = self.layout.box()
+        box.label(text='Unity animation clip cache')
+        box.prop(self, 'clip_cache_entries')
+        row = box.row()
+        row.prop(self, 'clip_cache_use_disk')
+        row.prop(self, 'clip_cache_disk_size')
+
+        self.layout.prop(self, 'shape_key_cache_size')
+
+def configure_clip_cache():
+    addon = bpy.context.preferences.addons.get(__package__)
+    if not addon:
+        return
+    prefs = addon.preferences
+    cache = unity.clip_cache
+    cache.max_entries = prefs.clip_cache_entries
+    cache.directory = unity.default_clip_cache_directory if prefs.clip_cache_use_disk else None
+    cache.max_disk_size = prefs.clip_cache_disk_size * 1024 * 1024
+    cache.trim()
+
+def configure_shape_key_cache():
+    addon = bpy.context.preferences.addons.get(__package__)
+    if not addon:
+        return
+    shapekey.delta_cache.max_bytes = addon.preferences.shape_key_cache_size * 1024 * 1024
+    shapekey.delta_cache.trim()
+
+def mode_switch():
+    addon_prefs = bpy.context.preferences.addons[__package__].preferences
+    warn = addon_prefs.warn_shapekey_edit
+    obj = bpy.context.active_object
+    if warn and obj and obj.type == 'MESH' and obj.mode == 'EDIT' and obj.active_shape_key_index != 0:
+        def draw(self, context):
+            self.layout.label(text=f'Editing shape key "{obj.active_shape_key.name}"')
+        bpy.context.window_manager.popup_menu(draw, title='Warning', icon='ERROR')
+
+@persistent
+def clear_unity_paths(*args):
+    unity.path_resolver.clear()
+
+@persistent
+def invalidate_shape_key_deltas(scene, depsgraph):
+    for update in depsgraph.updates:
+        data = update.id.original
+        if isinstance(data, bpy.types.Key):
+            data = data.user
+        if isinstance(data, bpy.types.Mesh):
+            shapekey.delta_cache.invalidate(data.as_pointer())
+
+@persistent
+def clear_shape_key_deltas(*args):
+    shapekey.delta_cache.clear()
+
+subscription_owner = object()
+
+@persistent
+def subscribe_to_mode_change(dummy):
+    bpy.msgbus.clear_by_owner(subscription_owner)
+    bpy.msgbus.subscribe_rna(
+        key=(bpy.types.Object, 'mode'),
+        owner=subscription_owner,
+        args=(),
+        notify=mode_switch,
+        options={'PERSISTENT'} # Not sure what this does
+    )
+
+def register():
+    for cls in blender_decorator.classes:
+        bpy.utils.register_class(cls)
+
+    for menu, entry in blender_decorator.menus:
+        menu.append(entry)
+
+    configure_clip_cache()
+    configure_shape_key_cache()
+
+    bpy.app.handlers.load_post.append(subscribe_to_mode_change)
+    bpy.app.handlers.load_post.append(clear_unity_paths)
+    bpy.app.handlers.depsgraph_update_post.append(clear_unity_paths)
+    bpy.app.handlers.load_post.append(clear_shape_key_deltas)
+    # Undo can restore a mesh's keys without reporting an update
+    bpy.app.handlers.undo_post.append(clear_shape_key_deltas)
+    bpy.app.handlers.redo_post.append(clear_shape_key_deltas)
+    bpy.app.handlers.depsgraph_update_post.append(invalidate_shape_key_deltas)
+
+    # In case the addon is enabled after loading a file, we need to subscribe here
+    subscribe_to_mode_change(None)
+
+def unregister():
+    bpy.app.handlers.depsgraph_update_post.remove(invalidate_shape_key_deltas)
+    bpy.app.handlers.redo_post.remove(clear_shape_key_deltas)
+    bpy.app.handlers.undo_post.remove(clear_shape_key_deltas)
+    bpy.app.handlers.load_post.remove(clear_shape_key_deltas)
+    bpy.app.handlers.depsgraph_update_post.remove(clear_unity_paths)
+    bpy.app.handlers.load_post.remove(clear_unity_paths)
+    bpy.app.handlers.load_post.remove(subscribe_to_mode_change)
+    bpy.msgbus.clear_by_owner(subscription_owner)
+
+    for cls in reversed(blender_decorator.classes):
+        bpy.utils.unregister_class(cls)
+
+    for menu, entry in reversed(blender_decorator.menus):
+        menu.remove(entry)
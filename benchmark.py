@@ -0,0 +1,153 @@
+import argparse
+import gc
+import itertools
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from . import bl_info, unity
+
+default_curve_counts = [10, 1000, 10000]
+default_key_counts = [1, 100, 10000]
+
+def synthetic_curves(num_curves, num_keys, sample_rate=60):
+    rng = np.random.default_rng(num_curves * 100003 + num_keys)
+    times = np.arange(num_keys) / sample_rate
+    curves = []
+    for i in range(num_curves):
+        values = np.clip(50 + 50 * np.sin(times * rng.uniform(0.5, 4) + rng.uniform(0, 6)), 0, 100)
+        curves.append(unity.curve('Body', unity.UnityClassID.SKINNED_MESH_RENDERER, f'blendShape.key_{i}', unity.baked_frames(times, values)))
+    return curves
+
+def time_best(function, repeat):
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return (best, result)
+
+# Run separately from the timings, which tracemalloc would slow down
+def peak_memory(function):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def read_clip_stream(clip_path, function):
+    with open(clip_path, 'rb') as f:
+        return function(f)
+
+def benchmark_case(num_curves, num_keys, directory, repeat, measure_memory):
+    curves = synthetic_curves(num_curves, num_keys)
+    clip_path = os.path.join(directory, f'clip_{num_curves}x{num_keys}.anim')
+    stages = []
+    if num_keys == 1:
+        shape_mix = {c['attribute'][len('blendShape.'):]: c['curve']['m_Curve'][0]['value'] / 100 for c in curves}
+        paths = [f'Root/Object_{i}' for i in range(num_curves)]
+        stages.append(('render', lambda: unity.make_blendshape_anim_clip('Clip', 'Body', shape_mix)))
+        stages.append(('render_toggle', lambda: unity.make_toggle_anim_clip('Clip', paths, True)))
+    else:
+        stages.append(('render', lambda: unity.make_animation_clip('Clip', curves, 60, (num_keys - 1) / 60)))
+    text = stages[0][1]()
+    num_bytes = len(text.encode('utf-8'))
+
+    def write():
+        if os.path.exists(clip_path):
+            os.unlink(clip_path)
+        return unity.write_if_changed(clip_path, text)
+
+    stages.append(('write', write))
+    write()
+    stages.append(('parse', lambda: read_clip_stream(clip_path, lambda f: unity.read_float_curves(f, all_frames=True))))
+    stages.append(('extract', lambda: read_clip_stream(clip_path, lambda f: unity.anim_clip_to_shape_mix(f, None))))
+
+    results = []
+    for (stage, function) in stages:
+        (seconds, output) = time_best(function, repeat)
+        # Rendering stages report the size of their own output
+        stage_bytes = len(output.encode('utf-8')) if isinstance(output, str) else num_bytes
+        result = {
+            'stage': stage,
+            'curves': num_curves,
+            'keys_per_curve': num_keys,
+            'bytes': stage_bytes,
+            'seconds': seconds,
+            'curves_per_second': num_curves / seconds if seconds else None,
+            'mb_per_second': stage_bytes / 1e6 / seconds if seconds else None,
+        }
+        if measure_memory:
+            result['peak_memory_bytes'] = peak_memory(function)
+        results.append(result)
+    os.unlink(clip_path)
+    return results
+
+def format_result(result, baseline=None):
+    line = (f"{result['stage']:<14}{result['curves']:>7} x {result['keys_per_curve']:<6}"
+            f"{result['seconds'] * 1000:>11.2f} ms{result['curves_per_second']:>14,.0f} curves/s{result['mb_per_second']:>9.1f} MB/s")
+    if 'peak_memory_bytes' in result:
+        line += f"{result['peak_memory_bytes'] / 1e6:>9.1f} MB peak"
+    if baseline:
+        line += f"  {baseline['seconds'] / result['seconds']:.2f}x baseline speed"
+    return line
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog=f'python -m {__package__}.benchmark',
+        description='Time rendering, writing, parsing and extracting synthetic Unity blendshape clips, without Blender')
+    parser.add_argument('--curves', type=int, nargs='+', default=default_curve_counts,
+                        help='numbers of curves per clip (default: %(default)s)')
+    parser.add_argument('--keys', type=int, nargs='+', default=default_key_counts,
+                        help='numbers of keys per curve (default: %(default)s)')
+    parser.add_argument('--max-keys', type=int, default=2_000_000,
+                        help='skip clips with more keys in total than this (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='time each stage this many times and keep the best (default: %(default)s)')
+    parser.add_argument('--no-memory', action='store_true',
+                        help='skip measuring peak memory with tracemalloc')
+    parser.add_argument('-o', '--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            for result in json.load(f)['results']:
+                baseline[(result['stage'], result['curves'], result['keys_per_curve'])] = result
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for (num_curves, num_keys) in itertools.product(args.curves, args.keys):
+            if num_curves * num_keys > args.max_keys:
+                print(f'{num_curves} x {num_keys}: skipped, more than {args.max_keys} keys')
+                continue
+            for result in benchmark_case(num_curves, num_keys, directory, args.repeat, not args.no_memory):
+                print(format_result(result, baseline.get((result['stage'], result['curves'], result['keys_per_curve']))))
+                results.append(result)
+
+    if args.output:
+        report = {
+            'version': '.'.join(map(str, bl_info['version'])),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'results': results,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
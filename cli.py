@@ -0,0 +1,210 @@
+import argparse
+import functools
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from . import unity
+
+def expand_inputs(patterns):
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True))
+        # Plain paths are kept even when missing, so that they are reported
+        if not matches and not glob.has_magic(pattern):
+            matches = [pattern]
+        paths.extend(matches)
+    return paths
+
+def map_jobs(function, items, jobs):
+    if jobs > 1 and len(items) > 1:
+        with ProcessPoolExecutor(jobs) as executor:
+            yield from executor.map(function, items, chunksize=max(1, len(items) // (jobs * 4)))
+    else:
+        yield from map(function, items)
+
+def clip_duration(curves):
+    return max((c.frames[-1]['time'] for c in curves if c.frames), default=0)
+
+def inspect_clip(path):
+    try:
+        curves = unity.read_float_curves(path, all_frames=True)
+    except Exception as e:
+        return f'{path}: error: {e}'
+    num_keys = sum(len(c.frames) for c in curves)
+    lines = [f'{path}: {len(curves)} curve(s), {num_keys} key(s), {clip_duration(curves):g}s']
+    for c in curves:
+        first_value = f', first value {c.frames[0]["value"]:g}' if c.frames else ''
+        lines.append(f'  {c.path or "<root>"} {c.attribute} ({c.class_id}): {len(c.frames)} key(s){first_value}')
+    return '\n'.join(lines)
+
+def _check_curve(index, curve):
+    problems = []
+    if not isinstance(curve, dict) or not isinstance(curve.get('curve'), dict):
+        return [f'm_FloatCurves[{index}]: missing curve']
+    if not isinstance(curve.get('attribute'), str) or not curve['attribute']:
+        problems.append(f'm_FloatCurves[{index}]: missing attribute')
+    if not isinstance(curve.get('classID'), int):
+        problems.append(f'm_FloatCurves[{index}]: missing classID')
+    keys = curve['curve'].get('m_Curve')
+    if not isinstance(keys, list):
+        return problems + [f'm_FloatCurves[{index}]: missing m_Curve']
+    previous_time = None
+    for key in keys:
+        time = key.get('time') if isinstance(key, dict) else None
+        if not isinstance(time, (int, float)) or not isinstance(key.get('value'), (int, float)):
+            problems.append(f'm_FloatCurves[{index}]: key without numeric time and value')
+            break
+        if previous_time is not None and time < previous_time:
+            problems.append(f'm_FloatCurves[{index}]: keys out of order at time {time:g}')
+            break
+        previous_time = time
+    return problems
+
+# Parses the whole clip with yaml, and checks that the fast curve reader
+# agrees with it
+def validate_clip(path):
+    try:
+        documents = unity.load_unity_yaml(path)
+    except Exception as e:
+        return (path, [f'not a valid Unity YAML file: {e}'])
+
+    if len(documents) != 1 or not isinstance(documents[0], dict) or not isinstance(documents[0].get('AnimationClip'), dict):
+        return (path, ['not a single AnimationClip document'])
+    clip = documents[0]['AnimationClip']
+
+    problems = []
+    for field in ('m_FloatCurves', 'm_EditorCurves'):
+        if not isinstance(clip.get(field), list):
+            problems.append(f'missing {field}')
+    if problems:
+        return (path, problems)
+    for (index, curve) in enumerate(clip['m_FloatCurves']):
+        problems.extend(_check_curve(index, curve))
+
+    if not problems and not unity.scanner_matches_parser(path):
+        problems.append('layout not understood by the fast curve reader')
+    return (path, problems)
+
+def convert_file(path, output_dir, object_path):
+    (root, ext) = os.path.splitext(path)
+    name = os.path.basename(root)
+    out_root = os.path.join(output_dir, name) if output_dir else root
+    if ext.lower() == '.anim':
+        out_path = out_root + '.json'
+        shape_mix = unity.anim_clip_to_shape_mix(path, None)
+        with open(out_path, 'w', encoding='utf-8') as f:
+            json.dump(shape_mix, f, indent=2, ensure_ascii=False)
+    elif ext.lower() == '.json':
+        out_path = out_root + '.anim'
+        with open(path, encoding='utf-8') as f:
+            shape_mix = json.load(f)
+        unity.write_if_changed(out_path, unity.make_blendshape_anim_clip(name, object_path, shape_mix))
+    else:
+        raise ValueError(f'{path}: expected an .anim or .json file')
+    return out_path
+
+def update_sidecar(path):
+    if unity.read_clip_sidecar(path) is not None:
+        return (path, False)
+    unity.write_clip_sidecar(path)
+    return (path, True)
+
+def read_all_curves(path):
+    return unity.read_float_curves(path, all_frames=True)
+
+def command_inspect(args, paths):
+    for report in map_jobs(inspect_clip, paths, args.jobs):
+        print(report)
+    return 0
+
+def command_validate(args, paths):
+    num_invalid = 0
+    for (path, problems) in map_jobs(validate_clip, paths, args.jobs):
+        if problems:
+            num_invalid += 1
+            for problem in problems:
+                print(f'{path}: {problem}')
+        elif args.verbose:
+            print(f'{path}: ok')
+    print(f'{len(paths) - num_invalid} of {len(paths)} clip(s) valid')
+    return 1 if num_invalid else 0
+
+def command_convert(args, paths):
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    convert = functools.partial(convert_file, output_dir=args.output_dir, object_path=args.path)
+    for out_path in map_jobs(convert, paths, args.jobs):
+        print(out_path)
+    return 0
+
+def command_sidecar(args, paths):
+    num_written = 0
+    for (path, written) in map_jobs(update_sidecar, paths, args.jobs):
+        if written:
+            num_written += 1
+            print(unity.sidecar_path(path))
+    print(f'{num_written} sidecar(s) written, {len(paths) - num_written} up to date')
+    return 0
+
+# Later clips replace curves with the same path, attribute and class
+def command_merge(args, paths):
+    merged = {}
+    for curves in map_jobs(read_all_curves, paths, args.jobs):
+        for c in curves:
+            merged[(c.path, c.attribute, c.class_id)] = c
+    curves = list(merged.values())
+    (root, _) = os.path.splitext(args.output)
+    name = args.name or os.path.basename(root)
+    duration = clip_duration(curves)
+    anim_clip = unity.make_animation_clip(
+        name,
+        [unity.curve(c.path, c.class_id, c.attribute, c.frames) for c in curves],
+        sample_rate=args.sample_rate,
+        stop_time=duration or None)
+    written = unity.write_if_changed(args.output, anim_clip)
+    print(f'{args.output}: {len(curves)} curve(s) from {len(paths)} clip(s){"" if written else ", unchanged"}')
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog=f'python -m {__package__}',
+        description='Inspect, validate, convert and merge Unity animation clips without Blender')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of worker processes (default: 1)')
+    # Also accepted after the command, without overriding it with a default
+    jobs_parser = argparse.ArgumentParser(add_help=False)
+    jobs_parser.add_argument('-j', '--jobs', type=int, default=argparse.SUPPRESS,
+                             help='number of worker processes (default: 1)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    inspect_parser = subparsers.add_parser('inspect', parents=[jobs_parser], help='list the float curves of each clip')
+    inspect_parser.set_defaults(run=command_inspect)
+
+    validate_parser = subparsers.add_parser('validate', parents=[jobs_parser], help='check that clips are well-formed')
+    validate_parser.add_argument('-v', '--verbose', action='store_true', help='also list valid clips')
+    validate_parser.set_defaults(run=command_validate)
+
+    convert_parser = subparsers.add_parser('convert', parents=[jobs_parser], help='convert clips to JSON shape mixes (first frame), and JSON shape mixes to clips')
+    convert_parser.add_argument('-o', '--output-dir', help='output folder (default: next to each input)')
+    convert_parser.add_argument('--path', default='', help='object path of blendshape curves in converted clips')
+    convert_parser.set_defaults(run=command_convert)
+
+    merge_parser = subparsers.add_parser('merge', parents=[jobs_parser], help='merge the float curves of several clips into one clip')
+    merge_parser.add_argument('-o', '--output', required=True, help='merged clip')
+    merge_parser.add_argument('--name', help='clip name (default: output file name)')
+    merge_parser.add_argument('--sample-rate', type=float, default=60, help='sample rate of the merged clip (default: 60)')
+    merge_parser.set_defaults(run=command_merge)
+
+    sidecar_parser = subparsers.add_parser('sidecar', parents=[jobs_parser], help='write binary sidecars for clips that have none or a stale one')
+    sidecar_parser.set_defaults(run=command_sidecar)
+
+    for subparser in (inspect_parser, validate_parser, convert_parser, merge_parser, sidecar_parser):
+        subparser.add_argument('inputs', nargs='+', help='input files or glob patterns (** matches subfolders)')
+
+    args = parser.parse_args(argv)
+    paths = expand_inputs(args.inputs)
+    if not paths:
+        parser.error('no input files')
+    return args.run(args, paths)
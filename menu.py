@@ -30,6 +30,10 @@ class OBJECT_MT_unity_blendshape_menu(Menu):
     def draw(self, context):
         self.layout.operator(OBJECT_OT_load_unity_blendshape_anim.bl_idname, text='Load Blendshape Animation', icon='FILEBROWSER')
         self.layout.operator(OBJECT_OT_save_unity_blendshape_anim.bl_idname, text='Save Blendshape Animation', icon='FILE_TICK')
+        self.layout.separator()
+        self.layout.operator(OBJECT_OT_load_unity_blendshape_anim_library.bl_idname, text='Load Blendshape Animation Library', icon='FILE_FOLDER')
+        self.layout.operator(OBJECT_OT_apply_unity_shape_mix_preset.bl_idname, text='Apply Shape Mix Preset', icon='SHAPEKEY_DATA')
+        self.layout.operator(OBJECT_OT_search_unity_blendshape_anims.bl_idname, text='Search Blendshape Animations', icon='VIEWZOOM')
 
 @register_menu(bpy.types.MESH_MT_shape_key_context_menu)
 def unity_blendshape_menu(self, context):
@@ -47,10 +51,28 @@ class OBJECT_MT_unity_object_menu(Menu):
 def unity_object_menu(self, context):
     self.layout.menu(OBJECT_MT_unity_object_menu.bl_idname)
 
+@register_class
+class OBJECT_MT_unity_pose_menu(Menu):
+    bl_idname = 'OBJECT_MT_unity_pose_menu'
+    bl_label = 'Unity'
+
+    def draw(self, context):
+        self.layout.operator(POSE_OT_save_unity_bone_anim.bl_idname, text='Save Bone Animation', icon='FILE_TICK')
+
+@register_menu(bpy.types.VIEW3D_MT_pose)
+def unity_pose_menu(self, context):
+    self.layout.menu(OBJECT_MT_unity_pose_menu.bl_idname)
+
+@register_menu(bpy.types.MESH_MT_shape_key_context_menu)
+def bake_shape_key_mix_menu(self, context):
+    self.layout.operator(OBJECT_OT_shapekey_bake_mix.bl_idname, icon='SHAPEKEY_DATA')
+
 #@register_menu(bpy.types.MESH_MT_shape_key_context_menu)
 @register_menu(bpy.types.VIEW3D_MT_object)
 def remove_empty_shapekeys_menu(self, context):
     self.layout.operator(OBJECT_OT_shapekey_remove_empty.bl_idname, icon='REMOVE')
+    self.layout.operator(OBJECT_OT_shapekey_merge_duplicates.bl_idname, icon='AUTOMERGE_OFF')
+    self.layout.operator(OBJECT_OT_shapekey_clean_noise.bl_idname, icon='BRUSH_SMOOTH')
 
 @register_class
 class OBJECT_MT_remove_empty_vertex_group_menu(Menu):
@@ -1,9 +1,189 @@
-import bpy
-from bpy.props import BoolProperty, FloatProperty
+import os
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from bpy.props import BoolProperty, EnumProperty, FloatProperty, IntProperty, StringProperty
 from bpy.types import Operator
 from ..blender_decorator import register_class
+from .. import shapekey
+from .unity import get_shape_mix_library, shape_mix_library_property
 import numpy as np
 
+# Removing a key only unlinks it and fixes up the relative keys of the
+# others, which costs microseconds even on dense meshes. Rebuilding the key
+# list without the removed keys would have to copy the coordinates of every
+# surviving key, so it is far slower. Keys are removed from the last one, so
+# that the indices of the others stay valid. Drivers of removed keys are
+# removed too, since they would fail on every evaluation, and the active key
+# stays active.
+def remove_shape_keys(obj, names):
+    key = obj.data.shape_keys
+    kbs = key.key_blocks
+    names = set(names)
+    active_name = obj.active_shape_key.name if obj.active_shape_key else None
+    if key.animation_data:
+        removed_paths = tuple(kbs[name].path_from_id() for name in names)
+        drivers = key.animation_data.drivers
+        for driver in [d for d in drivers if d.data_path.startswith(removed_paths)]:
+            drivers.remove(driver)
+    for i in sorted((kbs.find(name) for name in names), reverse=True):
+        obj.shape_key_remove(kbs[i])
+    if active_name and active_name not in names:
+        obj.active_shape_key_index = kbs.find(active_name)
+
+def mesh_with_shapekeys(o):
+    return o.type == 'MESH' and o.data.shape_keys and o.data.shape_keys.use_relative
+
+# Unique meshes with shape keys, and an object using each
+def selected_shape_key_meshes(context):
+    return {o.data: o for o in context.selected_objects if mesh_with_shapekeys(o)}
+
+# Default memory for shape key coordinates read at once, in MB
+default_memory_budget = 512
+
+def memory_budget_bytes(megabytes):
+    return megabytes * 2**20
+
+# Returns, for each mesh, a list of [name, relative key name, KeyDelta] for
+# each shape key other than the reference key, in order, and the peak memory
+# used. Without keep_arrays, the KeyDeltas only have their statistics. With
+# empty_threshold, whether each key is empty at that threshold replaces its
+# KeyDelta, which is faster as the comparison stops at the first vertex that
+# moves.
+#
+# Coordinates are read on the main thread, which is the only one allowed to
+# access Blender data, while the deltas are computed in a thread pool (NumPy
+# releases the GIL). Buffers are recycled, and keys in flight and cached
+# relative keys are bounded so that they fit in memory_budget bytes along
+# with the deltas kept, the largest deltas the keys in flight could make and
+# the delta cache, which is trimmed to what the rest leaves. A shape key and
+# its relative key are always read, even when that is over budget. Deltas held both here and by the cache count
+# twice, so the peak can overstate memory but not understate it.
+#
+# With use_cache, computed deltas are cached, and keys analysed earlier are
+# not read again unless their mesh has changed since. The cache misses edits
+# that Blender doesn't report, so operators that change the mesh read the
+# keys again.
+def analyze_shape_keys(meshes, include_muted=True, memory_budget=memory_budget_bytes(default_memory_budget),
+                       use_cache=False, keep_arrays=True, empty_threshold=None):
+    max_workers = os.cpu_count() or 1
+    pool = shapekey.BufferPool()
+    pending = deque()
+    analyses = {mesh: [] for mesh in meshes}
+    kept_bytes = 0
+    peak_bytes = 0
+
+    def result_nbytes(result):
+        return 0 if empty_threshold is not None else shapekey.delta_nbytes(result)
+
+    def held_bytes(extra=0):
+        return (pool.nbytes + kept_bytes + shapekey.delta_cache.nbytes
+                + max_workers * shapekey.chunk_scratch_nbytes + extra)
+
+    # The delta cache only gets what the budget leaves over the memory held
+    # and reserved bytes
+    def trim_cache(reserved):
+        shapekey.delta_cache.trim(memory_budget - (held_bytes() - shapekey.delta_cache.nbytes) - reserved)
+
+    # Finished deltas waiting to be collected count towards the peak
+    def note_peak(extra=0):
+        nonlocal peak_bytes
+        done = sum(result_nbytes(future.result()) for (*_, future) in pending if future.done())
+        peak_bytes = max(peak_bytes, held_bytes(done + extra))
+
+    def collect():
+        nonlocal kept_bytes
+        (mesh, analysis, locs, future) = pending.popleft()
+        result = future.result()
+        note_peak(result_nbytes(result))
+        if empty_threshold is None:
+            if use_cache:
+                shapekey.delta_cache.put(mesh.as_pointer(), analysis[0], analysis[1], len(mesh.vertices), result)
+            if not keep_arrays:
+                result = shapekey.strip_delta(result)
+            kept_bytes += shapekey.delta_nbytes(result)
+            if use_cache:
+                trim_cache(len(pending) * shapekey.max_delta_nbytes(len(mesh.vertices)))
+        analysis[2] = result
+        pool.give(locs)
+
+    # credit to https://blender.stackexchange.com/a/237611
+    with ThreadPoolExecutor(max_workers) as executor:
+        for mesh in meshes:
+            kbs = mesh.shape_keys.key_blocks
+            nverts = len(mesh.vertices)
+            key_bytes = nverts * 3 * np.dtype(np.float32).itemsize
+            delta_bytes = 0 if empty_threshold is not None else shapekey.max_delta_nbytes(nverts)
+
+            # A key, its rel key and its delta always fit
+            trim_cache(2 * key_bytes + delta_bytes)
+
+            # Cache locs for rel keys since many keys have the same rel key
+            rel_cache = shapekey.RelativeKeyCache(pool, key_bytes)
+
+            for kb in kbs:
+                if kb == kb.relative_key: continue
+                if kb.mute and not include_muted: continue
+
+                delta = None
+                if use_cache and empty_threshold is None:
+                    delta = shapekey.delta_cache.get(mesh.as_pointer(), kb.name, kb.relative_key.name, nverts, keep_arrays)
+                if delta is not None and not keep_arrays:
+                    delta = shapekey.strip_delta(delta)
+                analysis = [kb.name, kb.relative_key.name, delta]
+                analyses[mesh].append(analysis)
+                if delta is not None:
+                    kept_bytes += shapekey.delta_nbytes(delta)
+                    continue
+
+                rel_locs = rel_cache.get(kb.relative_key.name)
+                if rel_locs is None:
+                    # Keep room for a key and its delta besides the rel keys
+                    rel_cache.budget = max(key_bytes, memory_budget - held_bytes(key_bytes + delta_bytes) + rel_cache.nbytes)
+                    # Pending keys may still be reading the evicted rel key
+                    if rel_cache.needs_room(key_bytes):
+                        while pending:
+                            collect()
+                        rel_cache.make_room(key_bytes)
+                    rel_locs = pool.take(nverts * 3)
+                    kb.relative_key.data.foreach_get("co", rel_locs)
+                    rel_cache.put(kb.relative_key.name, rel_locs)
+
+                while pending and (len(pending) >= 2 * max_workers or
+                                   held_bytes(pool.allocation_nbytes(nverts * 3) + (len(pending) + 1) * delta_bytes) > memory_budget):
+                    collect()
+                locs = pool.take(nverts * 3)
+                kb.data.foreach_get("co", locs)
+                note_peak()
+
+                if empty_threshold is None:
+                    future = executor.submit(shapekey.key_delta, locs, rel_locs)
+                else:
+                    future = executor.submit(shapekey.is_empty_delta, locs, rel_locs, empty_threshold)
+                pending.append((mesh, analysis, locs, future))
+            while pending:
+                collect()
+            rel_cache.clear()
+            pool.clear()
+            # Deltas found in the cache are kept too
+            note_peak()
+    return (analyses, peak_bytes)
+
+# Bytes of the deltas in analyses, which stay in memory while they are used
+def analyses_nbytes(analyses):
+    return sum(shapekey.delta_nbytes(delta) for analysis in analyses.values() for (_, _, delta) in analysis)
+
+def describe_peak_memory(peak_bytes):
+    return (f'peak memory {peak_bytes / 2**20:.1f} MB, '
+            f'including {shapekey.delta_cache.nbytes / 2**20:.1f} MB of cached deltas')
+
+def describe_key_delta(delta, threshold):
+    if shapekey.is_empty(delta, threshold):
+        return f'would be deleted, largest offset {delta.max_offset:.6g}'
+    (low, high) = delta.bounds
+    return (f'moves {delta.num_moved} vertices, by up to {delta.max_displacement:.6g} ({delta.mean_displacement:.6g} on average), '
+            f'within ({", ".join(f"{v:.4g}" for v in low)}) to ({", ".join(f"{v:.4g}" for v in high)})')
+
 @register_class
 class OBJECT_OT_shapekey_remove_empty(Operator):
     """Delete empty shape keys"""
@@ -25,56 +205,398 @@ class OBJECT_OT_shapekey_remove_empty(Operator):
                              subtype='DISTANCE',
                              description="Delete shape keys where all vertices are within this distance from basis")
 
-    def execute(self, context):
-        def mesh_with_shapekeys(o):
-            return o.type == 'MESH' and o.data.shape_keys and o.data.shape_keys.use_relative
+    dry_run: BoolProperty(name='Report only',
+                          default=False,
+                          description='Only report which shape keys would be deleted, and how far each shape key moves vertices')
+
+    memory_budget: IntProperty(name='Memory budget (MB)',
+                               default=default_memory_budget,
+                               min=1,
+                               soft_max=8192,
+                               description='Memory for shape key coordinates and offsets held at once, including cached offsets. Lower it for very large meshes, at the cost of reading relative keys again')
 
-        # Collect unique meshes with shape keys
-        meshes = {o.data: o for o in bpy.context.selected_objects if mesh_with_shapekeys(o)}
+    def execute(self, context):
+        meshes = selected_shape_key_meshes(context)
         if len(meshes) == 0:
             self.report({'WARNING'}, 'no meshes with shape keys in selection')
             return {'CANCELLED'}
 
+        budget = memory_budget_bytes(self.memory_budget)
+        if self.dry_run:
+            (analyses, peak_bytes) = analyze_shape_keys(meshes, self.remove_muted, budget, use_cache=True, keep_arrays=False)
+        else:
+            (analyses, peak_bytes) = analyze_shape_keys(meshes, self.remove_muted, budget, empty_threshold=self.threshold)
+
         delete_count = 0
+        for (mesh, obj) in meshes.items():
+            if self.dry_run:
+                to_delete = [name for (name, _, delta) in analyses[mesh] if shapekey.is_empty(delta, self.threshold)]
+            else:
+                to_delete = [name for (name, _, empty) in analyses[mesh] if empty]
+            delete_count += len(to_delete)
+            if self.dry_run:
+                for (name, _, delta) in analyses[mesh]:
+                    self.report({'INFO'}, f'{obj.name}: shape key "{name}" {describe_key_delta(delta, self.threshold)}')
+            else:
+                remove_shape_keys(obj, to_delete)
+                for kb_name in to_delete:
+                    self.report({'INFO'}, f'{obj.name}: deleted shape key "{kb_name}"')
+
+        self.report({'INFO'}, f'{"Would delete" if self.dry_run else "Deleted"} {delete_count} shape keys, {describe_peak_memory(peak_bytes)}')
+        return {'FINISHED'}
+
+    @classmethod
+    def poll(cls, context):
+        return context.mode == 'OBJECT'
+
+@register_class
+class OBJECT_OT_shapekey_merge_duplicates(Operator):
+    """Merge shape keys that move the same vertices by the same offsets"""
+    bl_idname = 'object.shapekey_merge_duplicates'
+    bl_label = 'Merge Duplicate Shape Keys'
+    bl_options = {'REGISTER', 'UNDO'}
+
+    include_muted: BoolProperty(name='Include muted',
+                                default=False,
+                                description='Also merge muted shape keys')
+
+    threshold: FloatProperty(name='Threshold',
+                             default=0.0001,
+                             min=0,
+                             soft_max=0.1,
+                             step=0.1,
+                             precision=5,
+                             unit='LENGTH',
+                             subtype='DISTANCE',
+                             description='Merge shape keys where all vertices are within this distance from each other (0 for exact duplicates only)')
+
+    dry_run: BoolProperty(name='Report only',
+                          default=False,
+                          description='Only report which shape keys would be merged')
+
+    memory_budget: IntProperty(name='Memory budget (MB)',
+                               default=default_memory_budget,
+                               min=1,
+                               soft_max=8192,
+                               description='Memory for shape key coordinates and offsets held at once, including cached offsets. Lower it for very large meshes, at the cost of reading relative keys again')
+
+    def execute(self, context):
+        meshes = selected_shape_key_meshes(context)
+        if len(meshes) == 0:
+            self.report({'WARNING'}, 'no meshes with shape keys in selection')
+            return {'CANCELLED'}
 
-        # credit to https://blender.stackexchange.com/a/237611
-        for mesh, obj in meshes.items():
-            if not mesh.shape_keys: continue
-            if not mesh.shape_keys.use_relative: continue
+        (analyses, peak_bytes) = analyze_shape_keys(meshes, self.include_muted, memory_budget_bytes(self.memory_budget), use_cache=self.dry_run)
 
+        merge_count = 0
+        for (mesh, obj) in meshes.items():
             kbs = mesh.shape_keys.key_blocks
-            nverts = len(mesh.vertices)
+            # Empty keys are all alike, and left to Delete Empty Shape Keys.
+            # Keys with equal offsets still differ when they are masked by
+            # different vertex groups, or can't take the same values.
+            candidates = defaultdict(list)
+            for (name, relative_name, delta) in analyses[mesh]:
+                if delta.num_moved and not shapekey.is_empty(delta, self.threshold):
+                    kb = kbs[name]
+                    candidates[(relative_name, kb.vertex_group, kb.slider_min, kb.slider_max, kb.mute)].append((name, delta))
+            groups = [group for named_deltas in candidates.values()
+                      for group in shapekey.duplicate_groups(named_deltas, self.threshold)]
+
             to_delete = []
+            for (kept, *duplicates) in groups:
+                merge_count += len(duplicates)
+                quoted = ', '.join(f'"{name}"' for name in duplicates)
+                self.report({'INFO'}, f'{obj.name}: {"would merge" if self.dry_run else "merged"} {quoted} into "{kept}"')
+                if self.dry_run:
+                    continue
+                # The kept key takes over the duplicates' weights, which
+                # keeps the current shape as long as they fit its range
+                kb = kbs[kept]
+                kb.value = min(kb.slider_max, sum(kbs[name].value for name in [kept] + duplicates))
+                # Blender would make keys relative to a removed key relative
+                # to the basis instead
+                for dependent in kbs:
+                    if dependent.relative_key.name in duplicates:
+                        dependent.relative_key = kb
+                to_delete.extend(duplicates)
+            if to_delete:
+                remove_shape_keys(obj, to_delete)
 
-            # Cache locs for rel keys since many keys have the same rel key
-            cache = {}
+        self.report({'INFO'}, f'{"Would merge" if self.dry_run else "Merged"} {merge_count} shape keys, {describe_peak_memory(peak_bytes)}')
+        return {'FINISHED'}
 
-            locs = np.empty(nverts * 3, dtype=np.float32)
+    @classmethod
+    def poll(cls, context):
+        return context.mode == 'OBJECT'
 
-            for kb in kbs:
-                if kb == kb.relative_key: continue
-                if kb.mute and not self.remove_muted: continue
+# The shape keys of kbs other than the reference key, each after its
+# relative key. Keys in a cycle of relative keys come last, in order.
+def relative_key_order(kbs):
+    order = []
+    done = {kb.name for kb in kbs if kb == kb.relative_key}
+    remaining = [kb for kb in kbs if kb != kb.relative_key]
+    while remaining:
+        ready = [kb for kb in remaining if kb.relative_key.name in done]
+        if not ready:
+            order.extend(remaining)
+            break
+        order.extend(ready)
+        done.update(kb.name for kb in ready)
+        remaining = [kb for kb in remaining if kb.name not in done]
+    return order
+
+@register_class
+class OBJECT_OT_shapekey_clean_noise(Operator):
+    """Move vertices that barely move in shape keys back to their relative key"""
+    bl_idname = 'object.shapekey_clean_noise'
+    bl_label = 'Clean Shape Key Noise'
+    bl_options = {'REGISTER', 'UNDO'}
+
+    include_muted: BoolProperty(name='Include muted',
+                                default=True,
+                                description='Also clean muted shape keys')
+
+    threshold: FloatProperty(name='Threshold',
+                             default=0.0001,
+                             soft_min=0.00001,
+                             soft_max=0.1,
+                             step=0.1,
+                             precision=5,
+                             unit='LENGTH',
+                             subtype='DISTANCE',
+                             description='Move vertices back to the relative key when they are within this distance from it')
+
+    dry_run: BoolProperty(name='Report only',
+                          default=False,
+                          description='Only report how many vertices would be moved back in each shape key')
+
+    memory_budget: IntProperty(name='Memory budget (MB)',
+                               default=default_memory_budget,
+                               min=1,
+                               soft_max=8192,
+                               description='Memory for shape key coordinates and offsets held at once, including cached offsets. Lower it for very large meshes, at the cost of reading relative keys again')
+
+    def execute(self, context):
+        meshes = selected_shape_key_meshes(context)
+        if len(meshes) == 0:
+            self.report({'WARNING'}, 'no meshes with shape keys in selection')
+            return {'CANCELLED'}
+
+        budget = memory_budget_bytes(self.memory_budget)
+        pool = shapekey.BufferPool()
+        peak_bytes = 0
+        changes_bytes = 0
+
+        # Besides the buffers, the changes kept for dependent keys, the delta
+        # cache and the given arrays are in memory
+        def note_peak(*arrays):
+            nonlocal peak_bytes
+            peak_bytes = max(peak_bytes, pool.nbytes + changes_bytes + shapekey.delta_cache.nbytes
+                             + shapekey.chunk_scratch_nbytes + sum(array.nbytes for array in arrays))
+
+        key_count = 0
+        vertex_count = 0
+        for (mesh, obj) in meshes.items():
+            kbs = mesh.shape_keys.key_blocks
+            nverts = len(mesh.vertices)
+            if nverts == 0:
+                continue
+            key_bytes = nverts * 3 * np.dtype(np.float32).itemsize
+            # The delta cache only gets what is left after a key and its
+            # relative key
+            shapekey.delta_cache.trim(budget - 2 * key_bytes - shapekey.chunk_scratch_nbytes)
+            locs = pool.take(nverts * 3)
+            # Relative keys are read as few times as the budget allows, and
+            # kept up to date when they are cleaned themselves
+            rel_cache = shapekey.RelativeKeyCache(pool, key_bytes)
+            relative_names = {kb.relative_key.name for kb in kbs if kb != kb.relative_key}
+            # How each key that others are relative to was changed. Keys
+            # relative to it follow, so that their offsets stay the same.
+            changes = {}
+            changes_bytes = 0
+            changed = False
+
+            for kb in relative_key_order(kbs):
+                relative_name = kb.relative_key.name
+                rel_locs = rel_cache.get(relative_name)
+                if rel_locs is None:
+                    # The changes and the delta cache come out of the budget
+                    # too
+                    rel_cache.budget = max(key_bytes, budget - (pool.nbytes - rel_cache.nbytes) - key_bytes
+                                           - changes_bytes - shapekey.delta_cache.nbytes - shapekey.chunk_scratch_nbytes)
+                    rel_cache.make_room(key_bytes)
+                    rel_locs = pool.take(nverts * 3)
+                    kbs[relative_name].data.foreach_get("co", rel_locs)
+                    # Changes are only written when not reporting
+                    if self.dry_run and relative_name in changes:
+                        (indices, _, new) = changes[relative_name]
+                        rel_locs.reshape(-1, 3)[indices] = new
+                    rel_cache.put(relative_name, rel_locs)
+                rel_vectors = rel_locs.reshape(-1, 3)
 
                 kb.data.foreach_get("co", locs)
+                vectors = locs.reshape(-1, 3)
+                change = changes.get(relative_name, shapekey.no_change)
+                followed = change[0]
+                followed_old = vectors[followed]
+                shapekey.follow_change(vectors, change)
 
-                if kb.relative_key.name not in cache:
-                    rel_locs = np.empty(nverts * 3, dtype=np.float32)
-                    kb.relative_key.data.foreach_get("co", rel_locs)
-                    cache[kb.relative_key.name] = rel_locs
-                rel_locs = cache[kb.relative_key.name]
+                snapped = shapekey.no_change[0]
+                if self.include_muted or not kb.mute:
+                    (snapped, num_moved) = shapekey.small_offset_indices(locs, rel_locs, self.threshold)
+                if len(snapped):
+                    key_count += 1
+                    vertex_count += len(snapped)
+                    self.report({'INFO'}, f'{obj.name}: shape key "{kb.name}" {"would affect" if self.dry_run else "now affects"} '
+                                          f'{num_moved - len(snapped)} vertices, {len(snapped)} {"would be" if self.dry_run else "were"} moved back')
+                note_peak(snapped, followed_old)
+                if not len(snapped) and not len(followed):
+                    continue
 
-                locs -= rel_locs
-                if (np.abs(locs) < self.threshold).all():
-                    to_delete.append(kb.name)
+                if kb.name in relative_names:
+                    indices = np.union1d(followed, snapped).astype(np.int32)
+                    old = vectors[indices]
+                    old[np.searchsorted(indices, followed)] = followed_old
+                vectors[snapped] = rel_vectors[snapped]
+                if kb.name in relative_names:
+                    changes[kb.name] = shapekey.vertex_change(indices, old, vectors[indices])
+                    changes_bytes += sum(array.nbytes for array in changes[kb.name])
+                    note_peak(snapped, old)
+                if kb.name in rel_cache:
+                    rel_cache.get(kb.name)[:] = locs
+                if not self.dry_run:
+                    kb.data.foreach_set("co", locs)
+                    changed = True
 
-            delete_count += len(to_delete)
-            for kb_name in to_delete:
-                obj.shape_key_remove(mesh.shape_keys.key_blocks[kb_name])
-                self.report({'INFO'}, f'{obj.name}: deleted shape key "{kb_name}"')
+            rel_cache.clear()
+            pool.clear()
+            if changed:
+                # foreach_set is not reported as an update, so the deltas
+                # cached for this mesh have to be dropped here
+                shapekey.delta_cache.invalidate(mesh.as_pointer())
+                mesh.update()
 
-        self.report({'INFO'}, f'Deleted {delete_count} shape keys')
+        self.report({'INFO'}, f'{"Would move" if self.dry_run else "Moved"} back {vertex_count} vertices in {key_count} shape keys, '
+                              f'{describe_peak_memory(peak_bytes)}')
         return {'FINISHED'}
 
     @classmethod
     def poll(cls, context):
         return context.mode == 'OBJECT'
+
+# Weights by vertex of the named vertex groups of obj, read in one pass over
+# the vertices since there is no faster way. Missing groups are left out, as
+# Blender applies their shape keys fully.
+def vertex_group_weights(obj, names):
+    groups = {obj.vertex_groups[name].index: name for name in names if name in obj.vertex_groups}
+    weights = {name: np.zeros(len(obj.data.vertices), dtype=np.float32) for name in groups.values()}
+    if groups:
+        for v in obj.data.vertices:
+            for g in v.groups:
+                if g.group in groups:
+                    weights[groups[g.group]][v.index] = g.weight
+    return weights
+
+# The (KeyDelta, value, weights) of each shape key in deltas, by name, that
+# has a value once clamped to its slider range. Shape keys missing from
+# values are at zero.
+def shape_mix_keys(obj, deltas, values, weights):
+    kbs = obj.data.shape_keys.key_blocks
+    keys = []
+    for (name, delta) in deltas.items():
+        kb = kbs[name]
+        value = min(max(values.get(name, 0), kb.slider_min), kb.slider_max)
+        if value != 0 and delta.num_moved:
+            keys.append((delta, value, weights.get(kb.vertex_group)))
+    return keys
+
+@register_class
+class OBJECT_OT_shapekey_bake_mix(Operator):
+    """Bake the current shape key mix, or the active mesh's shape mix presets, to new shape keys or the basis"""
+    bl_idname = 'object.shapekey_bake_mix'
+    bl_label = 'Bake Shape Key Mix'
+    bl_options = {'REGISTER', 'UNDO'}
+
+    bake_to: EnumProperty(name='Bake to',
+                          items=[('NEW', 'New shape key', 'Add a shape key with the current mix'),
+                                 ('BASIS', 'Basis', 'Replace the basis with the current mix, keeping the effect of the other shape keys'),
+                                 ('PRESETS', 'Library presets', 'Add a shape key for each shape mix preset of the Unity blendshape animation library, named after it')],
+                          default='NEW')
+
+    name: StringProperty(name='Name',
+                         default='Mix',
+                         description='Name of the new shape key')
+
+    memory_budget: IntProperty(name='Memory budget (MB)',
+                               default=default_memory_budget,
+                               min=1,
+                               soft_max=8192,
+                               description='Memory for shape key coordinates and offsets held at once, including cached offsets. Lower it for very large meshes, at the cost of reading relative keys again')
+
+    def execute(self, context):
+        obj = context.active_object
+        mesh = obj.data
+        kbs = mesh.shape_keys.key_blocks
+        reference = mesh.shape_keys.reference_key
+
+        if self.bake_to == 'PRESETS':
+            if shape_mix_library_property not in mesh:
+                self.report({'ERROR'}, 'the active mesh has no shape mix presets')
+                return {'CANCELLED'}
+            shape_mixes = get_shape_mix_library(mesh)
+        else:
+            shape_mixes = {self.name: {kb.name: kb.value for kb in kbs}}
+
+        # Muted shape keys don't take part in the mix
+        (analyses, peak_bytes) = analyze_shape_keys({mesh: obj}, False, memory_budget_bytes(self.memory_budget))
+        deltas = {name: delta for (name, _, delta) in analyses[mesh]}
+        weights = vertex_group_weights(obj, {kbs[name].vertex_group for name in deltas})
+
+        nverts = len(mesh.vertices)
+        basis = np.empty(nverts * 3, dtype=np.float32)
+        reference.data.foreach_get("co", basis)
+        # Baking holds the deltas, the weights, the basis and mix, and for
+        # the basis the offset and a key, with temporaries of up to two of
+        # the largest deltas while mixing. The delta cache gets the rest of
+        # the budget.
+        bake_bytes = (analyses_nbytes(analyses) + sum(w.nbytes for w in weights.values())
+                      + (4 if self.bake_to == 'BASIS' else 2) * basis.nbytes
+                      + 2 * max((shapekey.delta_nbytes(delta) for delta in deltas.values()), default=0))
+        shapekey.delta_cache.trim(memory_budget_bytes(self.memory_budget) - bake_bytes)
+        peak_bytes = max(peak_bytes, bake_bytes + shapekey.delta_cache.nbytes)
+
+        if self.bake_to == 'BASIS':
+            keys = shape_mix_keys(obj, deltas, shape_mixes[self.name], weights)
+            mix = shapekey.mix_key_deltas(basis.copy(), keys)
+            # Every other shape key moves along with the basis, which keeps
+            # its offsets from its relative key
+            offset = mix - basis
+            locs = np.empty(nverts * 3, dtype=np.float32)
+            for kb in kbs:
+                if kb == reference: continue
+                kb.data.foreach_get("co", locs)
+                locs += offset
+                kb.data.foreach_set("co", locs)
+            reference.data.foreach_set("co", mix)
+            mesh.vertices.foreach_set("co", mix)
+            # The mixed shape keys are now part of the basis
+            for name in deltas:
+                kbs[name].value = 0
+            self.report({'INFO'}, f'Baked {len(keys)} shape keys into "{reference.name}", {describe_peak_memory(peak_bytes)}')
+        else:
+            for (name, values) in shape_mixes.items():
+                mix = shapekey.mix_key_deltas(basis.copy(), shape_mix_keys(obj, deltas, values, weights))
+                kb = obj.shape_key_add(name=name, from_mix=False)
+                kb.data.foreach_set("co", mix)
+                self.report({'INFO'}, f'{obj.name}: baked shape key "{kb.name}"')
+            self.report({'INFO'}, f'Baked {len(shape_mixes)} shape keys, {describe_peak_memory(peak_bytes)}')
+
+        # foreach_set is not reported as an update
+        shapekey.delta_cache.invalidate(mesh.as_pointer())
+        mesh.update()
+        return {'FINISHED'}
+
+    @classmethod
+    def poll(cls, context):
+        obj = context.active_object
+        return context.mode == 'OBJECT' and obj and mesh_with_shapekeys(obj)
@@ -1,11 +1,37 @@
+import json
 import os.path
+import time
 
 import bpy
-from bpy.props import StringProperty, BoolProperty
+from bpy.props import StringProperty, BoolProperty, EnumProperty, IntProperty, FloatProperty
 from bpy.types import Operator
 from bpy_extras.io_utils import ImportHelper, ExportHelper
 from ..blender_decorator import register_class
 from .. import unity
+import numpy as np
+
+def apply_shape_mix(obj, shape_mix, clear, unpin_active_shape_key):
+    key_blocks = obj.data.shape_keys.key_blocks
+
+    if clear:
+        bpy.ops.object.shape_key_clear()
+
+    if unpin_active_shape_key:
+        obj.show_only_shape_key = False
+
+    for name, value in shape_mix.items():
+        if name in key_blocks:
+            key_blocks[name].value = value
+
+# Stored as JSON, as clip and blendshape names can exceed the ID property
+# name length limit
+shape_mix_library_property = 'unity_shape_mix_library'
+
+def get_shape_mix_library(mesh):
+    return json.loads(mesh.get(shape_mix_library_property, '{}'))
+
+def set_shape_mix_library(mesh, library):
+    mesh[shape_mix_library_property] = json.dumps(library)
 
 @register_class
 class OBJECT_OT_load_unity_blendshape_anim(Operator, ImportHelper):
@@ -32,36 +58,252 @@ class OBJECT_OT_load_unity_blendshape_anim(Operator, ImportHelper):
                                      default=True,
                                      description="Load blendshapes even when the referenced object name doesn't match the active object")
 
+    import_animation: BoolProperty(name='Import animation',
+                                   default=False,
+                                   description='Create shape key animation from every frame of the clip, starting at the scene start frame')
+
     def execute(self, context):
         obj = context.active_object
-        key_blocks = obj.data.shape_keys.key_blocks
-        object_path = unity.make_unity_object_path(obj)
+        object_path = unity.path_resolver.object_path(obj)
+        path = object_path if self.ignore_object_name else None
 
-        with open(self.filepath) as f:
-            # Remove YAML tag
-            lines = f.readlines()[3:]
-            shape_mix = unity.anim_clip_to_shape_mix(
-                '\n'.join(lines),
-                object_path if self.ignore_object_name else None)
-
-        if self.clear:
-            bpy.ops.object.shape_key_clear()
+        if self.import_animation:
+            curves = unity.clip_cache.float_curves(self.filepath, all_frames=True)
+            shape_key_frames = unity.blendshape_curves(curves, path)
+            shape_mix = {name: frames[0]['value'] / 100 for name, frames in shape_key_frames.items()}
+        else:
+            shape_mix = unity.anim_clip_to_shape_mix(self.filepath, path)
 
-        if self.unpin_active_shape_key:
-            obj.show_only_shape_key = False
+        apply_shape_mix(obj, shape_mix, self.clear, self.unpin_active_shape_key)
 
-        for name, value in shape_mix.items():
-            if name in key_blocks:
-                key_blocks[name].value = value
+        basename = os.path.basename(self.filepath)
+        if self.import_animation:
+            render = context.scene.render
+            fps = render.fps / render.fps_base
+            num_keyframes = import_shape_key_animation(obj.data.shape_keys, shape_key_frames, fps, context.scene.frame_start)
+            self.report({'INFO'}, f'{basename}: loaded {num_keyframes} keyframe(s)')
+            return {'FINISHED'}
 
         num_changed = len(shape_mix)
-        basename = os.path.basename(self.filepath)
         if num_changed > 0:
             self.report({'INFO'}, f'{basename}: loaded {num_changed} shape key weight(s)')
         else:
             self.report({'WARNING'}, f'{basename}: no applicable shape keys found')
         return {'FINISHED'}
 
+# Replaces the f-curve of each matching shape key. Keyframes are added and
+# positioned in bulk; handle types and interpolation have no bulk setter.
+def import_shape_key_animation(key, shape_key_frames, fps, frame_start):
+    anim_data = key.animation_data or key.animation_data_create()
+    if not anim_data.action:
+        anim_data.action = bpy.data.actions.new(name=f'{key.name}Action')
+    fcurves = anim_data.action.fcurves
+
+    num_keyframes = 0
+    for name, frames in shape_key_frames.items():
+        kb = key.key_blocks.get(name)
+        if not kb:
+            continue
+
+        data_path = kb.path_from_id('value')
+        fcurve = fcurves.find(data_path)
+        if fcurve:
+            fcurves.remove(fcurve)
+        fcurve = fcurves.new(data_path)
+
+        (co, handle_left, handle_right, constant) = unity.frames_to_bezier(frames, fps, frame_start)
+        points = fcurve.keyframe_points
+        points.add(len(frames))
+        for point in points:
+            point.handle_left_type = 'FREE'
+            point.handle_right_type = 'FREE'
+        for i in np.flatnonzero(constant).tolist():
+            points[i].interpolation = 'CONSTANT'
+        points.foreach_set('co', co)
+        points.foreach_set('handle_left', handle_left)
+        points.foreach_set('handle_right', handle_right)
+        fcurve.update()
+        num_keyframes += len(frames)
+    return num_keyframes
+
+@register_class
+class OBJECT_OT_load_unity_blendshape_anim_library(Operator):
+    """Load the shape mix of each Unity blendshape animation in a folder as a preset on the active mesh"""
+    bl_idname = 'object.load_unity_blendshape_anim_library'
+    bl_label = 'Load Unity Blendshape Animation Library'
+    bl_options = {'REGISTER', 'UNDO'}
+
+    # fileselect_add dialog uses these two properties
+    directory: StringProperty(
+        name="Library Location",
+        description="Folder containing animation clips"
+    )
+    filter_folder: BoolProperty(default=True, options={'HIDDEN'})
+
+    recursive: BoolProperty(name='Include subfolders',
+                            default=True,
+                            description='Also load animation clips in subfolders')
+
+    replace: BoolProperty(name='Replace library',
+                          default=False,
+                          description='Remove previously loaded presets from the active mesh')
+
+    use_sidecars: BoolProperty(name='Use binary sidecars',
+                               default=False,
+                               description='Save a hidden binary copy of each clip next to it, and load from it while the clip is unchanged')
+
+    @classmethod
+    def poll(cls, context):
+        obj = context.active_object
+        return obj and obj.type == 'MESH'
+
+    def execute(self, context):
+        mesh = context.active_object.data
+        start = time.perf_counter()
+        loaded = unity.load_shape_mix_library(self.directory, recursive=self.recursive, use_sidecars=self.use_sidecars)
+        elapsed = time.perf_counter() - start
+
+        library = {} if self.replace else get_shape_mix_library(mesh)
+        library.update(loaded)
+        set_shape_mix_library(mesh, library)
+
+        self.report({'INFO'}, f'Loaded {len(loaded)} preset(s) in {elapsed:.2f}s')
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+
+# Blender requires a reference to be kept to dynamic enum items
+shape_mix_preset_items = []
+
+def get_shape_mix_preset_items(self, context):
+    obj = context.active_object
+    library = get_shape_mix_library(obj.data) if obj and obj.type == 'MESH' else {}
+    shape_mix_preset_items[:] = [(name, name, '') for name in library]
+    return shape_mix_preset_items
+
+@register_class
+class OBJECT_OT_apply_unity_shape_mix_preset(Operator):
+    """Apply a shape mix preset from the active mesh's Unity blendshape animation library"""
+    bl_idname = 'object.apply_unity_shape_mix_preset'
+    bl_label = 'Apply Shape Mix Preset'
+    bl_options = {'REGISTER', 'UNDO'}
+    bl_property = 'preset'
+
+    preset: EnumProperty(name='Preset', items=get_shape_mix_preset_items)
+
+    clear: BoolProperty(name='Clear other shape keys',
+                        default=True,
+                        description='Set to zero each shape key unaffected by the preset')
+
+    unpin_active_shape_key: BoolProperty(name='Unpin active shape key',
+                                         default=True,
+                                         description='Disable the shape key lock')
+
+    @classmethod
+    def poll(cls, context):
+        obj = context.active_object
+        return obj and obj.type == 'MESH' and obj.data.shape_keys and shape_mix_library_property in obj.data
+
+    def execute(self, context):
+        obj = context.active_object
+        shape_mix = get_shape_mix_library(obj.data)[self.preset]
+        apply_shape_mix(obj, shape_mix, self.clear, self.unpin_active_shape_key)
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        context.window_manager.invoke_search_popup(self)
+        return {'RUNNING_MODAL'}
+
+# Indexes stay open for the session, since the search popup queries its
+# index on every redraw
+clip_indexes = {}
+
+def get_clip_index(directory):
+    directory = os.path.abspath(bpy.path.abspath(directory))
+    index = clip_indexes.get(directory)
+    if index is None:
+        index = clip_indexes[directory] = unity.open_clip_index(directory)
+    return index
+
+@register_class
+class OBJECT_OT_search_unity_blendshape_anims(Operator):
+    """Find the Unity animation clips of a project that animate a blendshape"""
+    bl_idname = 'object.search_unity_blendshape_anims'
+    bl_label = 'Search Unity Blendshape Animations'
+
+    directory: StringProperty(name='Unity project',
+                              subtype='DIR_PATH',
+                              description='Folder searched for animation clips, including subfolders, such as a Unity project or its Assets folder')
+
+    query: StringProperty(name='Blendshape',
+                          description='Name, or part of the name, of the blendshape to search for')
+
+    exact: BoolProperty(name='Exact name',
+                        default=False,
+                        description='Only find blendshapes with exactly this name, instead of names containing it')
+
+    max_results: IntProperty(name='Max results',
+                             default=50,
+                             min=1,
+                             soft_max=500,
+                             options={'SKIP_SAVE'})
+
+    def refresh_index(self):
+        start = time.perf_counter()
+        (num_read, num_removed, num_unchanged) = get_clip_index(self.directory).refresh()
+        elapsed = time.perf_counter() - start
+        return f'Indexed {num_read} new or changed clip(s), removed {num_removed}, {num_unchanged} unchanged, in {elapsed:.2f}s'
+
+    def execute(self, context):
+        if not self.directory:
+            self.report({'ERROR'}, 'No Unity project selected')
+            return {'CANCELLED'}
+        message = self.refresh_index()
+        matches = get_clip_index(self.directory).search_blendshape(self.query, self.exact) if self.query else []
+        self.report({'INFO'}, f'{message}; {len(matches)} clip(s) match')
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        key = context.active_object.active_shape_key if context.active_object else None
+        if key and not self.query:
+            self.query = key.name
+        if self.directory:
+            self.report({'INFO'}, self.refresh_index())
+        return context.window_manager.invoke_props_dialog(self, width=600)
+
+    def draw(self, context):
+        layout = self.layout
+        layout.prop(self, 'directory')
+        row = layout.row()
+        row.prop(self, 'query')
+        row.prop(self, 'exact')
+        if not self.directory or not self.query:
+            return
+
+        index = get_clip_index(self.directory)
+        if not len(index):
+            layout.label(text='No clips indexed yet, press OK to index the project', icon='INFO')
+            return
+        matches = index.search_blendshape(self.query, self.exact, limit=self.max_results)
+        if not matches:
+            layout.label(text='No matching clips')
+            return
+
+        column = layout.column(align=True)
+        column.operator_context = 'EXEC_DEFAULT'
+        for match in matches:
+            row = column.row()
+            row.label(text=match.clip_path, icon='ACTION')
+            if not self.exact:
+                row.label(text=', '.join(match.attributes))
+            row.label(text=f'{match.num_frames} frame(s)')
+            load = row.operator(OBJECT_OT_load_unity_blendshape_anim.bl_idname, text='Load', icon='IMPORT')
+            load.filepath = os.path.join(index.directory, match.clip_path)
+        if len(matches) == self.max_results:
+            layout.label(text=f'Only the first {self.max_results} matches are listed')
+
 @register_class
 class OBJECT_OT_save_unity_blendshape_anim(Operator, ExportHelper):
     """Save shape key mix as Unity blendshape animation"""
@@ -74,23 +316,209 @@ class OBJECT_OT_save_unity_blendshape_anim(Operator, ExportHelper):
         options={'HIDDEN'},
     )
 
+    bake_animation: BoolProperty(name='Bake animation',
+                                 default=False,
+                                 description='Save animated shape key values over a frame range instead of only the current values')
+
+    frame_start: IntProperty(name='Start frame',
+                             description='First frame to bake, saved at the start of the clip')
+
+    frame_end: IntProperty(name='End frame',
+                           description='Last frame to bake')
+
+    tolerance: FloatProperty(name='Key reduction',
+                             default=0.001,
+                             min=0,
+                             soft_max=0.01,
+                             step=0.01,
+                             precision=4,
+                             description='Remove baked keys while the animation stays within this distance of each frame (0 to keep every frame)')
+
+    def execute(self, context):
+        obj = context.active_object
+        (root, _) = os.path.splitext(self.filepath)
+        clip_name = os.path.basename(root)
+        object_path = unity.path_resolver.object_path(obj)
+
+        if self.bake_animation:
+            render = context.scene.render
+            fps = render.fps / render.fps_base
+            frame_end = max(self.frame_start, self.frame_end)
+            shape_key_curves = {
+                name: ((frames - self.frame_start) / fps, values)
+                for name, (frames, values) in sample_shape_key_animation(obj.data.shape_keys, self.frame_start, frame_end).items()
+            }
+            anim_clip = unity.make_baked_blendshape_anim_clip(
+                clip_name,
+                object_path,
+                shape_key_curves,
+                sample_rate=fps,
+                stop_time=(frame_end - self.frame_start) / fps,
+                tolerance=self.tolerance)
+        else:
+            shape_keys = {}
+            for key in obj.data.shape_keys.key_blocks:
+                if key.value >= 0.01:
+                    shape_keys[key.name] = key.value
+            anim_clip = unity.make_blendshape_anim_clip(clip_name, object_path, shape_keys)
+
+        if unity.write_if_changed(self.filepath, anim_clip):
+            self.report({'INFO'}, f'Saved {os.path.basename(self.filepath)}')
+        else:
+            self.report({'INFO'}, f'{os.path.basename(self.filepath)} is unchanged, skipped')
+
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        if not self.properties.is_property_set('frame_start'):
+            self.frame_start = context.scene.frame_start
+        if not self.properties.is_property_set('frame_end'):
+            self.frame_end = context.scene.frame_end
+        return ExportHelper.invoke(self, context, event)
+
+# Evaluates the shape key f-curves directly instead of stepping the scene
+# through each frame, which would re-evaluate the whole depsgraph every time.
+# Keys without animation are saved as a single frame when non-zero.
+def sample_shape_key_animation(key, frame_start, frame_end):
+    frames = np.arange(frame_start, frame_end + 1, dtype=np.float64)
+    action = key.animation_data.action if key.animation_data else None
+    curves = {}
+    for kb in key.key_blocks:
+        fcurve = action.fcurves.find(kb.path_from_id('value')) if action else None
+        if fcurve and not fcurve.mute:
+            values = np.fromiter(map(fcurve.evaluate, frames.tolist()), dtype=np.float64, count=len(frames))
+            curves[kb.name] = (frames, values)
+        elif kb.value >= 0.01:
+            curves[kb.name] = (frames[:1], np.array([kb.value]))
+    return curves
+
+# Bone positions in Unity per Blender unit, for rigs exported with the FBX
+# exporter's "Apply Scalings" option at a scale of 1, and imported with
+# "Convert Units". "All Local" and "FBX Custom Scale" put the unit conversion
+# on the armature, so bones are in the file's centimeters.
+def fbx_bone_unit_scale(scene, apply_scale_options):
+    if apply_scale_options in {'FBX_SCALE_NONE', 'FBX_SCALE_CUSTOM'}:
+        return 0.01
+    return 1.0 if scene.unit_settings.system == 'NONE' else scene.unit_settings.scale_length
+
+@register_class
+class POSE_OT_save_unity_bone_anim(Operator, ExportHelper):
+    """Save the animation of the selected pose bones as Unity transform curves"""
+    bl_idname = 'pose.save_unity_bone_anim'
+    bl_label = 'Save Unity Bone Animation'
+    filename_ext = '.anim'
+
+    filter_glob: StringProperty(
+        default="*.anim",
+        options={'HIDDEN'},
+    )
+
+    frame_start: IntProperty(name='Start frame',
+                             description='First frame to bake, saved at the start of the clip')
+
+    frame_end: IntProperty(name='End frame',
+                           description='Last frame to bake')
+
+    tolerance: FloatProperty(name='Key reduction',
+                             default=0.0001,
+                             min=0,
+                             soft_max=0.01,
+                             step=0.001,
+                             precision=5,
+                             description='Remove baked keys while the animation stays within this distance of each frame, in Blender units and quaternion components (0 to keep every frame)')
+
+    apply_scale_options: EnumProperty(name='Apply Scalings',
+                                      items=[('FBX_SCALE_NONE', 'All Local', 'The rig was exported with the FBX exporter\'s default scaling, which Unity imports with a scale of 100 on the armature'),
+                                             ('FBX_SCALE_UNITS', 'FBX Units Scale', 'The rig was exported with the FBX exporter\'s "FBX Units Scale" scaling'),
+                                             ('FBX_SCALE_CUSTOM', 'FBX Custom Scale', 'The rig was exported with the FBX exporter\'s "FBX Custom Scale" scaling'),
+                                             ('FBX_SCALE_ALL', 'FBX All', 'The rig was exported with the FBX exporter\'s "FBX All" scaling, which Unity imports with a scale of 1 on the armature')],
+                                      default='FBX_SCALE_NONE',
+                                      description='How the rig was exported to FBX, which sets the units of bone positions in Unity')
+
+    @classmethod
+    def poll(cls, context):
+        obj = context.active_object
+        return bool(obj and obj.type == 'ARMATURE' and context.mode == 'POSE' and context.selected_pose_bones)
+
     def execute(self, context):
         obj = context.active_object
         (root, _) = os.path.splitext(self.filepath)
         clip_name = os.path.basename(root)
+        bones = [pb for pb in context.selected_pose_bones if pb.id_data == obj]
+        paths = [unity.path_resolver.bone_path(obj, pb.bone) for pb in bones]
 
-        shape_keys = {}
-        for key in obj.data.shape_keys.key_blocks:
-            if key.value >= 0.01:
-                shape_keys[key.name] = key.value
+        render = context.scene.render
+        fps = render.fps / render.fps_base
+        frame_end = max(self.frame_start, self.frame_end)
+        rest = np.array([pb.bone.matrix_local for pb in bones])
+        parent_rest = np.array([pb.parent.bone.matrix_local if pb.parent else np.identity(4) for pb in bones])
+        basis = sample_pose_bone_matrices(context.scene, obj, bones, self.frame_start, frame_end)
+        unit_scale = fbx_bone_unit_scale(context.scene, self.apply_scale_options)
+        (positions, rotations, scales) = unity.pose_to_unity_transforms(basis, rest, parent_rest, unit_scale)
+        anim_clip = unity.make_transform_anim_clip(
+            clip_name,
+            paths,
+            np.arange(len(basis)) / fps,
+            positions,
+            rotations,
+            scales,
+            sample_rate=fps,
+            stop_time=(frame_end - self.frame_start) / fps,
+            tolerance=self.tolerance,
+            position_tolerance=self.tolerance * unit_scale)
 
-        object_path = unity.make_unity_object_path(obj)
-        anim_clip = unity.make_blendshape_anim_clip(clip_name, object_path, shape_keys)
-        with open(self.filepath, 'w', encoding='utf-8') as f:
-            f.write(anim_clip)
+        if unity.write_if_changed(self.filepath, anim_clip):
+            self.report({'INFO'}, f'Saved {len(bones)} bone(s) to {os.path.basename(self.filepath)}')
+        else:
+            self.report({'INFO'}, f'{os.path.basename(self.filepath)} is unchanged, skipped')
 
         return {'FINISHED'}
 
+    def invoke(self, context, event):
+        if not self.properties.is_property_set('frame_start'):
+            self.frame_start = context.scene.frame_start
+        if not self.properties.is_property_set('frame_end'):
+            self.frame_end = context.scene.frame_end
+        return ExportHelper.invoke(self, context, event)
+
+# Returns the matrix_basis of each bone at each frame, with shape
+# (frames, bones, 4, 4). All pose bones are read at once per frame, and the
+# scene is restored to its current frame afterwards.
+def sample_pose_bone_matrices(scene, obj, bones, frame_start, frame_end):
+    pose_bones = obj.pose.bones
+    indices = [pose_bones.find(pb.name) for pb in bones]
+    buffer = np.empty((len(pose_bones), 4, 4), dtype=np.float32)
+    frames = range(frame_start, frame_end + 1)
+    matrices = np.empty((len(frames), len(bones), 4, 4))
+    (frame_current, subframe) = (scene.frame_current, scene.frame_subframe)
+    try:
+        for (i, frame) in enumerate(frames):
+            scene.frame_set(frame)
+            pose_bones.foreach_get('matrix_basis', buffer.ravel())
+            # Matrices are read column by column
+            matrices[i] = buffer[indices].transpose(0, 2, 1)
+    finally:
+        scene.frame_set(frame_current, subframe=subframe)
+    return matrices
+
+# Object names may contain path separators, so names can collide once those
+# are replaced, or on case-insensitive file systems. Colliding names get a
+# numbered suffix, in name order, but names used as is go first.
+def toggle_anim_file_prefixes(objs):
+    prefixes = {}
+    used = set()
+    bases = {obj: obj.name.replace('/', '_').replace('\\', '_') for obj in objs}
+    for obj in sorted(objs, key=lambda obj: (bases[obj] != obj.name, obj.name)):
+        base = bases[obj]
+        prefix = base
+        n = 2
+        while prefix.casefold() in used:
+            prefix = f'{base}_{n}'
+            n += 1
+        used.add(prefix.casefold())
+        prefixes[obj] = prefix
+    return prefixes
+
 @register_class
 class OBJECT_OT_save_unity_toggle_anims(Operator):
     """Save enable/disable Unity animations"""
@@ -113,23 +541,40 @@ class OBJECT_OT_save_unity_toggle_anims(Operator):
                                           default='Disable.anim',
                                           description='Filename of clip which sets IsActive to false')
 
+    per_object: BoolProperty(name='Per object',
+                             default=False,
+                             description='Save an enable/disable pair for each selected object, named after the object followed by "Enable" or "Disable"')
+
     def execute(self, context):
         dir_path = self.directory
         objs = context.selected_objects
-        object_paths = [unity.make_unity_object_path(obj) for obj in objs]
+        object_paths = unity.path_resolver.object_paths(objs)
 
-        (enable_anim_name, _) = os.path.splitext(self.enable_anim_filename)
-        enable_anim_path = os.path.join(dir_path, self.enable_anim_filename)
-        enable_anim_clip = unity.make_toggle_anim_clip(enable_anim_name, object_paths, is_active=True)
-        with open(enable_anim_path, 'w', encoding='utf-8') as f:
-            f.write(enable_anim_clip)
+        if self.per_object:
+            prefixes = toggle_anim_file_prefixes(objs)
+            for obj in objs:
+                if prefixes[obj] != obj.name:
+                    self.report({'WARNING'}, f'Saving "{obj.name}" as {prefixes[obj]}Enable.anim/{prefixes[obj]}Disable.anim')
+            targets = [(prefixes[obj], [path]) for obj, path in zip(objs, object_paths)]
+            filenames = (('Enable.anim', True), ('Disable.anim', False))
+        else:
+            if self.enable_anim_filename.casefold() == self.disable_anim_filename.casefold():
+                self.report({'ERROR'}, 'Enable and Disable clips must have different filenames')
+                return {'CANCELLED'}
+            targets = [('', object_paths)]
+            filenames = ((self.enable_anim_filename, True), (self.disable_anim_filename, False))
 
-        (disable_anim_name, _) = os.path.splitext(self.disable_anim_filename)
-        disable_anim_path = os.path.join(dir_path, self.disable_anim_filename)
-        disable_anim_clip = unity.make_toggle_anim_clip(disable_anim_name, object_paths, is_active=False)
-        with open(disable_anim_path, 'w', encoding='utf-8') as f:
-            f.write(disable_anim_clip)
+        jobs = []
+        for (prefix, paths) in targets:
+            for (filename, is_active) in filenames:
+                (anim_name, _) = os.path.splitext(prefix + filename)
+                jobs.append((os.path.join(dir_path, prefix + filename), anim_name, paths, is_active))
 
+        start = time.perf_counter()
+        num_written = unity.write_toggle_anim_clips(jobs)
+        elapsed = time.perf_counter() - start
+        self.report({'INFO'}, f'Saved {num_written} animation(s), skipped {len(jobs) - num_written} unchanged, '
+                              f'in {elapsed:.2f}s ({len(jobs) / max(elapsed, 1e-6):.0f} clips/s)')
         return {'FINISHED'}
 
     def invoke(self, context, event):
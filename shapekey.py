@@ -0,0 +1,347 @@
+import hashlib
+import threading
+from collections import OrderedDict, defaultdict, namedtuple
+
+import numpy as np
+
+# Number of coordinates processed at a time, a whole number of vertices, and
+# small enough for a chunk of each array and the buffer to stay in cache
+chunk_size = 3 * 4096
+
+_thread_buffers = threading.local()
+
+# A full chunk buffer per thread and dtype, reused by every call on that
+# thread
+def thread_chunk_buffer(dtype=np.float32):
+    if not hasattr(_thread_buffers, 'buffers'):
+        _thread_buffers.buffers = {}
+    buffers = _thread_buffers.buffers
+    dtype = np.dtype(dtype)
+    if dtype not in buffers:
+        buffers[dtype] = np.empty(chunk_size, dtype=dtype)
+    return buffers[dtype]
+
+# Arrays recycled by size, so that processing many keys only allocates as
+# many buffers as are in use at once. peak_bytes is the most memory held by
+# the pool's buffers at any time, whether in use or not.
+class BufferPool:
+    def __init__(self):
+        self._free = defaultdict(list)
+        self.nbytes = 0
+        self.peak_bytes = 0
+
+    def take(self, size, dtype=np.float32):
+        free = self._free[(size, np.dtype(dtype))]
+        if free:
+            return free.pop()
+        buffer = np.empty(size, dtype=dtype)
+        self.nbytes += buffer.nbytes
+        self.peak_bytes = max(self.peak_bytes, self.nbytes)
+        return buffer
+
+    # Bytes that taking an array would allocate, 0 when a free one is reused
+    def allocation_nbytes(self, size, dtype=np.float32):
+        return 0 if self._free[(size, np.dtype(dtype))] else size * np.dtype(dtype).itemsize
+
+    def give(self, buffer):
+        self._free[(len(buffer), buffer.dtype)].append(buffer)
+
+    # Drops all buffers, which must no longer be in use
+    def clear(self):
+        self._free.clear()
+        self.nbytes = 0
+
+# Relative key coordinates by name, holding at most budget bytes, except that
+# the last array put is always kept. Least recently used arrays are evicted
+# first and given back to pool, so callers must check needs_room and stop
+# using cached arrays before putting another one.
+class RelativeKeyCache:
+    def __init__(self, pool, budget):
+        self.pool = pool
+        self.budget = budget
+        self.nbytes = 0
+        self._arrays = OrderedDict()
+
+    def __contains__(self, name):
+        return name in self._arrays
+
+    def get(self, name):
+        array = self._arrays.get(name)
+        if array is not None:
+            self._arrays.move_to_end(name)
+        return array
+
+    # Whether putting an array of nbytes would evict another one
+    def needs_room(self, nbytes):
+        return bool(self._arrays) and self.nbytes + nbytes > self.budget
+
+    # Evicts arrays until nbytes more fit, so that their buffers can be taken
+    # again for the next array
+    def make_room(self, nbytes):
+        while self.needs_room(nbytes):
+            (_, evicted) = self._arrays.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+            self.pool.give(evicted)
+
+    def put(self, name, array):
+        self.make_room(array.nbytes)
+        self._arrays[name] = array
+        self.nbytes += array.nbytes
+
+    def clear(self):
+        for array in self._arrays.values():
+            self.pool.give(array)
+        self._arrays.clear()
+        self.nbytes = 0
+
+# The vertices a shape key moves relative to its relative key, with their
+# offsets, so that later passes don't have to read the whole key again.
+# max_offset is the largest offset along any axis, and bounds the (min, max)
+# corners of the moved vertices, or None when no vertex moves. indices and
+# deltas are None when only the statistics were kept.
+KeyDelta = namedtuple('KeyDelta', ['indices', 'deltas', 'num_moved', 'max_offset', 'max_displacement', 'mean_displacement', 'bounds'])
+
+def delta_nbytes(delta):
+    return 0 if delta.indices is None else delta.indices.nbytes + delta.deltas.nbytes
+
+# The most bytes the KeyDelta of a key of num_vertices can take, when every
+# vertex moves
+def max_delta_nbytes(num_vertices, dtype=np.float32):
+    return num_vertices * (np.dtype(np.int32).itemsize + 3 * np.dtype(dtype).itemsize)
+
+# Bytes of the chunk buffer and chunk-sized temporaries a thread holds while
+# computing a delta
+chunk_scratch_nbytes = 4 * chunk_size * np.dtype(np.float64).itemsize
+
+def strip_delta(delta):
+    return delta._replace(indices=None, deltas=None)
+
+def _chunk_vectors(co, relative_co, buffer, start, end):
+    offsets = buffer[:end - start]
+    np.subtract(co[start:end], relative_co[start:end], out=offsets)
+    return offsets.reshape(-1, 3)
+
+# co and relative_co are flat xyz arrays, as read by foreach_get. Offsets are
+# computed in chunks in buffer (by default the thread's chunk buffer), once
+# to count the moved vertices and once to fill arrays of exactly that size,
+# so that nothing larger than the result is allocated. Noisy keys move every
+# vertex. NaN counts as moved.
+def key_delta(co, relative_co, buffer=None):
+    if buffer is None:
+        buffer = thread_chunk_buffer(co.dtype)
+    step = len(buffer) - len(buffer) % 3
+    chunks = [(start, min(start + step, len(co))) for start in range(0, len(co), step)]
+
+    num_moved = 0
+    for (start, end) in chunks:
+        num_moved += np.count_nonzero((_chunk_vectors(co, relative_co, buffer, start, end) != 0).any(axis=1))
+    indices = np.empty(num_moved, dtype=np.int32)
+    deltas = np.empty((num_moved, 3), dtype=co.dtype)
+    if not num_moved:
+        return KeyDelta(indices, deltas, 0, 0.0, 0.0, 0.0, None)
+
+    # Per-chunk maxima are combined with np.max, which keeps NaN
+    (max_offsets, max_lengths, lows, highs) = ([], [], [], [])
+    length_sum = 0.0
+    position = 0
+    for (start, end) in chunks:
+        vectors = _chunk_vectors(co, relative_co, buffer, start, end)
+        moved = np.flatnonzero((vectors != 0).any(axis=1))
+        if not len(moved):
+            continue
+        indices[position:position + len(moved)] = moved + start // 3
+        chunk_deltas = deltas[position:position + len(moved)]
+        chunk_deltas[:] = vectors[moved]
+        position += len(moved)
+        lengths = np.sqrt(np.einsum('ij,ij->i', chunk_deltas, chunk_deltas))
+        max_offsets.append(np.abs(chunk_deltas).max())
+        max_lengths.append(lengths.max())
+        length_sum += float(lengths.sum())
+        positions = co[start:end].reshape(-1, 3)[moved]
+        lows.append(positions.min(axis=0))
+        highs.append(positions.max(axis=0))
+    return KeyDelta(
+        indices,
+        deltas,
+        num_moved,
+        float(np.max(max_offsets)),
+        float(np.max(max_lengths)),
+        length_sum / num_moved,
+        (np.min(lows, axis=0), np.max(highs, axis=0)))
+
+# Whether every vertex of co is within threshold of relative_co along each
+# axis, like is_empty(key_delta(co, relative_co), threshold). The scan stops
+# at the first chunk that moves that far, so non-empty keys are usually
+# rejected without reading them whole. NaN counts as moved.
+def is_empty_delta(co, relative_co, threshold, buffer=None):
+    if buffer is None:
+        buffer = thread_chunk_buffer(co.dtype)
+    step = len(buffer) - len(buffer) % 3
+    for start in range(0, len(co), step):
+        chunk = _chunk_vectors(co, relative_co, buffer, start, min(start + step, len(co)))
+        np.abs(chunk, out=chunk)
+        if not chunk.max() < threshold:
+            return False
+    return True
+
+# Whether no vertex moves threshold or more along any axis
+def is_empty(delta, threshold):
+    return delta.max_offset < threshold
+
+# Indices of the vertices of co that move relative to relative_co, but less
+# than threshold along every axis, and the number of vertices that move at
+# all. Computed in chunks like key_delta.
+def small_offset_indices(co, relative_co, threshold, buffer=None):
+    if buffer is None:
+        buffer = thread_chunk_buffer(co.dtype)
+    step = len(buffer) - len(buffer) % 3
+    index_chunks = [np.empty(0, dtype=np.int32)]
+    num_moved = 0
+    for start in range(0, len(co), step):
+        vectors = _chunk_vectors(co, relative_co, buffer, start, min(start + step, len(co)))
+        moved = (vectors != 0).any(axis=1)
+        num_moved += np.count_nonzero(moved)
+        np.abs(vectors, out=vectors)
+        small = np.flatnonzero(moved & (vectors.max(axis=1) < threshold))
+        index_chunks.append((small + start // 3).astype(np.int32))
+    return (np.concatenate(index_chunks), num_moved)
+
+# How the coordinates of a key changed, as vertex indices with their old and
+# new coordinates
+no_change = (np.empty(0, dtype=np.int32), np.empty((0, 3), dtype=np.float32), np.empty((0, 3), dtype=np.float32))
+
+def vertex_change(indices, old, new):
+    changed = (old != new).any(axis=1)
+    return (indices[changed], old[changed], new[changed])
+
+# Moves the vertices of vectors, the coordinates of a key relative to a key
+# that changed, so that their offsets from it stay the same. Vertices that
+# matched the old coordinates match the new ones exactly.
+def follow_change(vectors, change):
+    (indices, old, new) = change
+    vectors[indices] = new + (vectors[indices] - old)
+
+# Deltas are hashed with their offsets rounded to multiples of tolerance, so
+# that matching keys share a bucket and only keys within the same bucket are
+# compared. Offsets that round to zero are left out, like unmoved vertices.
+def _delta_signature(delta, tolerance):
+    digest = hashlib.sha1()
+    if tolerance > 0:
+        # NaN offsets can't be rounded, but such keys never match anyway
+        with np.errstate(invalid='ignore'):
+            quantized = np.round(delta.deltas / tolerance).astype(np.int64)
+        moved = quantized.any(axis=1)
+        digest.update(delta.indices[moved].tobytes())
+        digest.update(quantized[moved].tobytes())
+    else:
+        digest.update(delta.indices.tobytes())
+        digest.update(delta.deltas.tobytes())
+    return digest.digest()
+
+# Whether every vertex of a is within tolerance of the same vertex of b,
+# along each axis
+def deltas_equal(a, b, tolerance=0):
+    if tolerance == 0:
+        return np.array_equal(a.indices, b.indices) and np.array_equal(a.deltas, b.deltas)
+    indices = np.union1d(a.indices, b.indices)
+    if not len(indices):
+        return True
+    difference = np.zeros((len(indices), 3), dtype=np.float64)
+    difference[np.searchsorted(indices, a.indices)] += a.deltas
+    difference[np.searchsorted(indices, b.indices)] -= b.deltas
+    return bool(np.abs(difference).max() <= tolerance)
+
+# named_deltas is a sequence of (name, KeyDelta) of keys with the same
+# relative key. Returns groups of names of equal keys, each in the order of
+# named_deltas. Exact duplicates always share a bucket, but keys that only
+# match within tolerance can be missed when their offsets round differently.
+def duplicate_groups(named_deltas, tolerance=0):
+    buckets = defaultdict(list)
+    for (name, delta) in named_deltas:
+        buckets[_delta_signature(delta, tolerance)].append((name, delta))
+    groups = []
+    for members in buckets.values():
+        while len(members) > 1:
+            (first, first_delta) = members[0]
+            matches = [deltas_equal(first_delta, delta, tolerance) for (_, delta) in members[1:]]
+            same = [name for ((name, _), match) in zip(members[1:], matches) if match]
+            if same:
+                groups.append([first] + same)
+            members = [member for (member, match) in zip(members[1:], matches) if not match]
+    return groups
+
+# Adds a mix of shape keys to co, the flat xyz coordinates of the reference
+# key, in place, like Blender does. keys is a sequence of (KeyDelta, value,
+# weights), with weights by vertex from the key's vertex group, or None.
+def mix_key_deltas(co, keys):
+    vectors = co.reshape(-1, 3)
+    for (delta, value, weights) in keys:
+        if weights is None:
+            vectors[delta.indices] += value * delta.deltas
+        else:
+            vectors[delta.indices] += (value * weights[delta.indices])[:, np.newaxis] * delta.deltas
+    return co
+
+# Key deltas by mesh and key name, which the addon invalidates whenever
+# Blender reports an update of the mesh or its shape keys. Changing a shape
+# key's value is reported the same way as editing it, so it invalidates the
+# mesh's deltas too. Entries are also checked against the relative key and
+# vertex count, but edits that Blender doesn't report, such as foreach_set,
+# go unnoticed, so only reports should rely on them.
+#
+# Deltas of noisy keys are as large as the keys, so the cache holds at most
+# max_bytes of arrays, evicting the least recently used entries first. Deltas
+# too large for the cache on their own keep only their statistics.
+class DeltaCache:
+    def __init__(self, max_bytes=256 * 2**20):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._mesh_keys = defaultdict(set)
+
+    def clear(self):
+        self._entries.clear()
+        self._mesh_keys.clear()
+        self.nbytes = 0
+
+    def _remove(self, entry_key):
+        (_, delta) = self._entries.pop(entry_key)
+        self.nbytes -= delta_nbytes(delta)
+        keys = self._mesh_keys[entry_key[0]]
+        keys.discard(entry_key)
+        if not keys:
+            del self._mesh_keys[entry_key[0]]
+
+    def invalidate(self, mesh_id):
+        for entry_key in list(self._mesh_keys.get(mesh_id, ())):
+            self._remove(entry_key)
+
+    # Evicts entries until the arrays fit in max_bytes, or in max_bytes
+    # passed here when smaller, e.g. what is left of an operator's budget
+    def trim(self, max_bytes=None):
+        max_bytes = self.max_bytes if max_bytes is None else max(0, min(self.max_bytes, max_bytes))
+        while self.nbytes > max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    # With need_arrays, entries that only kept their statistics are misses
+    def get(self, mesh_id, key_name, relative_name, num_vertices, need_arrays=True):
+        entry = self._entries.get((mesh_id, key_name))
+        if not entry or entry[0] != (relative_name, num_vertices):
+            return None
+        if need_arrays and entry[1].indices is None:
+            return None
+        self._entries.move_to_end((mesh_id, key_name))
+        return entry[1]
+
+    def put(self, mesh_id, key_name, relative_name, num_vertices, delta):
+        entry_key = (mesh_id, key_name)
+        if entry_key in self._entries:
+            self._remove(entry_key)
+        if delta_nbytes(delta) > self.max_bytes:
+            delta = strip_delta(delta)
+        self._entries[entry_key] = ((relative_name, num_vertices), delta)
+        self._mesh_keys[mesh_id].add(entry_key)
+        self.nbytes += delta_nbytes(delta)
+        self.trim()
+
+delta_cache = DeltaCache()
@@ -0,0 +1,29 @@
+import importlib
+import os
+import sys
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(root))
+package = os.path.basename(root)
+cli = importlib.import_module(package + '.cli')
+unity = importlib.import_module(package + '.unity')
+
+def write_clip(tmp_path, name):
+    path = tmp_path / f'{name}.anim'
+    path.write_text(unity.make_blendshape_anim_clip(name, 'Body', {'Smile': 0.5}), encoding='utf-8')
+    return str(path)
+
+def test_jobs_before_or_after_command(tmp_path, capsys):
+    paths = [write_clip(tmp_path, 'A'), write_clip(tmp_path, 'B')]
+    assert cli.main(['-j', '2', 'validate'] + paths) == 0
+    assert cli.main(['validate', '-j', '2', '-v'] + paths) == 0
+    assert cli.main(['validate'] + paths) == 0
+    assert '2 of 2 clip(s) valid' in capsys.readouterr().out
+
+def test_validate_reports_layouts_the_scanner_skips(tmp_path):
+    path = tmp_path / 'Flow.anim'
+    text = unity.make_animation_clip('Flow', [unity.curve('Body', unity.UnityClassID.SKINNED_MESH_RENDERER, 'blendShape.Smile', [])])
+    path.write_text(text.replace('m_Curve: []', 'm_Curve: [{time: 0, value: 1}]', 1), encoding='utf-8')
+    (_, problems) = cli.validate_clip(str(path))
+    assert problems == ['layout not understood by the fast curve reader']
+    assert unity.scanner_matches_parser(write_clip(tmp_path, 'A'))
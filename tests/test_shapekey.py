@@ -0,0 +1,155 @@
+import importlib
+import os
+import sys
+
+import numpy as np
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(root))
+shapekey = importlib.import_module(os.path.basename(root) + '.shapekey')
+
+# Two vertices per chunk, so that every test crosses chunk boundaries
+small_buffer = np.empty(7, dtype=np.float32)
+
+def coordinates(vectors):
+    return np.array(vectors, dtype=np.float32).ravel()
+
+def delta(indices, deltas):
+    deltas = np.array(deltas, dtype=np.float32).reshape(-1, 3)
+    return shapekey.KeyDelta(np.array(indices, dtype=np.int32), deltas, len(indices), 0.0, 0.0, 0.0, None)
+
+basis = coordinates([[0, 0, 0], [1, 0, 0], [0, 1, 0], [0, 0, 1], [1, 1, 1]])
+
+def test_key_delta():
+    co = basis.copy()
+    co[3:6] += (0, 0.5, 0)
+    co[12:15] += (-2, 0, 0)
+    for buffer in (None, small_buffer):
+        d = shapekey.key_delta(co, basis, buffer)
+        assert d.indices.tolist() == [1, 4]
+        assert d.deltas.tolist() == [[0, 0.5, 0], [-2, 0, 0]]
+        assert (d.num_moved, d.max_offset, d.max_displacement, d.mean_displacement) == (2, 2.0, 2.0, 1.25)
+        assert np.array_equal(d.bounds[0], [-1, 0.5, 0]) and np.array_equal(d.bounds[1], [1, 1, 1])
+        assert shapekey.delta_nbytes(d) == 2 * 4 + 2 * 3 * 4
+        assert shapekey.strip_delta(d).indices is None and shapekey.delta_nbytes(shapekey.strip_delta(d)) == 0
+
+def test_key_delta_without_moved_or_any_vertices():
+    for co in (basis, np.empty(0, dtype=np.float32)):
+        d = shapekey.key_delta(co.copy(), co, small_buffer)
+        assert (len(d.indices), d.deltas.shape, d.num_moved, d.max_offset, d.bounds) == (0, (0, 3), 0, 0.0, None)
+        assert shapekey.is_empty(d, 0.001)
+        assert shapekey.is_empty_delta(co.copy(), co, 0.001, small_buffer)
+        (indices, num_moved) = shapekey.small_offset_indices(co.copy(), co, 0.001, small_buffer)
+        assert (indices.tolist(), num_moved, indices.dtype) == ([], 0, np.int32)
+
+def test_nan_counts_as_moved():
+    co = basis.copy()
+    co[7] = np.nan
+    d = shapekey.key_delta(co, basis, small_buffer)
+    assert d.indices.tolist() == [2]
+    assert np.isnan(d.max_offset) and not shapekey.is_empty(d, 1)
+    assert not shapekey.is_empty_delta(co, basis, 1, small_buffer)
+    (indices, num_moved) = shapekey.small_offset_indices(co, basis, 1, small_buffer)
+    assert (indices.tolist(), num_moved) == ([], 1)
+
+def test_is_empty_delta_matches_key_delta():
+    rng = np.random.default_rng(0)
+    for scale in (0, 1e-6, 1e-3, 1):
+        co = basis + (rng.normal(size=basis.shape) * scale).astype(np.float32)
+        d = shapekey.key_delta(co, basis, small_buffer)
+        for threshold in (1e-5, 1e-2):
+            assert shapekey.is_empty_delta(co, basis, threshold, small_buffer) == shapekey.is_empty(d, threshold)
+
+def test_small_offset_indices():
+    co = basis.copy()
+    co[0] += 0.0001
+    co[4] += 0.5
+    co[14] -= 0.0002
+    (indices, num_moved) = shapekey.small_offset_indices(co, basis, 0.001, small_buffer)
+    assert (indices.tolist(), num_moved) == ([0, 4], 3)
+
+def test_follow_change_keeps_offsets():
+    relative = basis.reshape(-1, 3).copy()
+    key = relative + np.float32(0.25)
+    change = shapekey.vertex_change(np.array([0, 2, 3], dtype=np.int32), relative[[0, 2, 3]],
+                                    relative[[0, 2, 3]] + np.array([[1, 0, 0], [0, 0, 0], [0, -1, 0]], dtype=np.float32))
+    assert change[0].tolist() == [0, 3]
+    relative[change[0]] = change[2]
+    # Unchanged vertices of a key that matched the relative key still do
+    matching = relative.copy()
+    matching[change[0]] = change[1]
+    shapekey.follow_change(key, change)
+    shapekey.follow_change(matching, change)
+    assert np.allclose(key - relative, 0.25)
+    assert np.array_equal(matching, relative)
+    shapekey.follow_change(key, shapekey.no_change)
+    assert np.allclose(key - relative, 0.25)
+
+def test_deltas_equal():
+    a = delta([1, 3], [[0, 1, 0], [1, 0, 0]])
+    assert shapekey.deltas_equal(a, delta([1, 3], [[0, 1, 0], [1, 0, 0]]))
+    assert not shapekey.deltas_equal(a, delta([1, 3], [[0, 1, 0], [1, 0, 0.001]]))
+    assert shapekey.deltas_equal(a, delta([1, 3], [[0, 1, 0], [1, 0, 0.001]]), 0.01)
+    # Vertices that only one key moves count as moved by zero in the other
+    assert shapekey.deltas_equal(a, delta([1, 2, 3], [[0, 1, 0], [0.005, 0, 0], [1, 0, 0]]), 0.01)
+    assert not shapekey.deltas_equal(a, delta([1], [[0, 1, 0]]), 0.01)
+    assert shapekey.deltas_equal(delta([], []), delta([], []), 0.01)
+    nan = delta([1], [[np.nan, 0, 0]])
+    assert not shapekey.deltas_equal(nan, nan) and not shapekey.deltas_equal(nan, nan, 0.01)
+
+def test_duplicate_groups():
+    a = delta([1, 3], [[0, 1, 0], [1, 0, 0]])
+    named = [
+        ('a', a),
+        ('b', delta([0, 2], [[0, 1, 0], [1, 0, 0]])),
+        ('a2', delta([1, 3], [[0, 1, 0], [1, 0, 0]])),
+        ('near', delta([1, 3], [[0, 1, 0], [1, 0, 0.00001]])),
+        ('b2', delta([0, 2], [[0, 1, 0], [1, 0, 0]])),
+        ('a3', delta([1, 3], [[0, 1, 0], [1, 0, 0]])),
+        ('nan', delta([1], [[np.nan, 0, 0]])),
+        ('nan2', delta([1], [[np.nan, 0, 0]])),
+        ('empty', delta([], [])),
+        ('empty2', delta([], [])),
+    ]
+    assert shapekey.duplicate_groups(named) == [['a', 'a2', 'a3'], ['b', 'b2'], ['empty', 'empty2']]
+    # Within tolerance, near matches join, and offsets that round to zero
+    # count as unmoved
+    named.append(('tiny', delta([4], [[0.0001, 0, 0]])))
+    groups = sorted(shapekey.duplicate_groups(named, 0.001))
+    assert groups == [['a', 'a2', 'near', 'a3'], ['b', 'b2'], ['empty', 'empty2', 'tiny']]
+
+def test_mix_key_deltas():
+    a = delta([1, 3], [[0, 1, 0], [1, 0, 0]])
+    b = delta([3, 4], [[0, 0, 2], [-1, 0, 0]])
+    weights = np.array([1, 1, 1, 0.5, 0], dtype=np.float32)
+    co = shapekey.mix_key_deltas(basis.copy(), [(a, 0.5, None), (b, 1, weights)])
+    assert co.reshape(-1, 3).tolist() == [[0, 0, 0], [1, 0.5, 0], [0, 1, 0], [0.5, 0, 2], [1, 1, 1]]
+    assert np.array_equal(shapekey.mix_key_deltas(basis.copy(), []), basis)
+    assert shapekey.mix_key_deltas(np.empty(0, dtype=np.float32), [(delta([], []), 1, None)]).shape == (0,)
+
+def test_delta_cache():
+    cache = shapekey.DeltaCache(max_bytes=100)
+    small = delta([1], [[1, 0, 0]])
+    large = delta(list(range(10)), np.ones((10, 3)))
+    cache.put(1, 'a', 'Basis', 5, small)
+    assert cache.get(1, 'a', 'Basis', 5) is small
+    assert cache.get(1, 'a', 'Other', 5) is None and cache.get(1, 'a', 'Basis', 6) is None
+    # Too large to cache whole, so only the statistics are kept
+    cache.put(1, 'b', 'Basis', 5, large)
+    assert cache.get(1, 'b', 'Basis', 5) is None
+    assert cache.get(1, 'b', 'Basis', 5, need_arrays=False).num_moved == 10
+    for i in range(10):
+        cache.put(2, str(i), 'Basis', 5, small)
+    assert cache.nbytes <= 100 and cache.get(1, 'a', 'Basis', 5) is None
+    cache.invalidate(2)
+    assert cache.nbytes == 0 and cache.get(2, '9', 'Basis', 5) is None
+
+def test_delta_cache_trims_to_a_smaller_limit():
+    cache = shapekey.DeltaCache(max_bytes=1000)
+    for i in range(4):
+        cache.put(1, str(i), 'Basis', 5, delta([1], [[i, 0, 0]]))
+    cache.get(1, '0', 'Basis', 5)
+    cache.trim(32)
+    assert cache.nbytes == 32 and cache.get(1, '0', 'Basis', 5) is not None and cache.get(1, '1', 'Basis', 5) is None
+    cache.trim(-1)
+    assert cache.nbytes == 0
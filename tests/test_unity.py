@@ -0,0 +1,315 @@
+import importlib
+import io
+import math
+import os
+import sys
+
+import numpy as np
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(root))
+unity = importlib.import_module(os.path.basename(root) + '.unity')
+
+def test_reduce_keyframes_keeps_both_keys_of_two_samples():
+    frames = unity.baked_frames([0, 1 / 60], [0, 100], tolerance=0.1)
+    assert [f['value'] for f in frames] == [0, 100]
+
+def test_reduce_keyframes_constant():
+    assert unity.reduce_keyframes(np.arange(2.0), np.array([5.0, 5.0]), 0.1).tolist() == [0]
+    assert unity.reduce_keyframes(np.arange(0.0), np.array([]), 0.1).tolist() == []
+
+unity_clip = '''%YAML 1.1
+%TAG !u! tag:unity3d.com,2011:
+--- !u!74 &7400000
+AnimationClip:
+  m_ObjectHideFlags: 0
+  m_Name: Smile
+  m_RotationCurves: []
+  m_PositionCurves: []
+  m_FloatCurves:
+  - curve:
+      serializedVersion: 2
+      m_Curve:
+      - serializedVersion: 3
+        time: 0
+        value: 100
+        inSlope: Infinity
+        outSlope: -Infinity
+        tangentMode: 103
+        weightedMode: 0
+        inWeight: 0.33333334
+        outWeight: 0.33333334
+      - serializedVersion: 3
+        time: 0.5
+        value: 25.5
+        inSlope: 0
+        outSlope: 0
+        tangentMode: 136
+        weightedMode: 0
+        inWeight: 0.33333334
+        outWeight: 0.33333334
+      m_PreInfinity: 2
+      m_PostInfinity: 2
+      m_RotationOrder: 4
+    attribute: blendShape.Smile
+    path: Body
+    classID: 137
+    script: {fileID: 0}
+  - curve:
+      serializedVersion: 2
+      m_Curve: []
+      m_PreInfinity: 2
+      m_PostInfinity: 2
+      m_RotationOrder: 4
+    attribute: blendShape.Blink
+    path: 'Armature/Hat #2'
+    classID: 137
+    script: {fileID: 0}
+  - curve:
+      serializedVersion: 2
+      m_Curve:
+      - serializedVersion: 3
+        time: 0
+        value: 1
+        inSlope: 0
+        outSlope: 0
+        tangentMode: 136
+        weightedMode: 0
+        inWeight: 0.33333334
+        outWeight: 0.33333334
+      m_PreInfinity: 2
+      m_PostInfinity: 2
+      m_RotationOrder: 4
+    attribute: m_IsActive
+    path: "Hat \\"B\\"/\\u00e9"
+    classID: 1
+    script: {fileID: 0}
+  m_PPtrCurves: []
+  m_SampleRate: 60
+  m_EditorCurves: []
+'''
+
+def scan(text, all_frames=True):
+    return unity._scan_unity_file(io.BytesIO(text.encode('utf-8')), all_frames)
+
+def parse(text, all_frames=True):
+    return unity._parse_float_curves(io.BytesIO(text.encode('utf-8')), all_frames)
+
+def test_scanner_matches_parser_on_unity_layout():
+    for all_frames in (True, False):
+        curves = scan(unity_clip, all_frames)
+        assert curves == parse(unity_clip, all_frames)
+    assert [c.path for c in curves] == ['Body', 'Armature/Hat #2', 'Hat "B"/é']
+    assert [len(c.frames) for c in curves] == [1, 0, 1]
+    curves = scan(unity_clip)
+    assert curves[0].frames[0]['inSlope'] == math.inf
+    assert curves[0].frames[0]['outSlope'] == -math.inf
+    assert curves[0].frames[1]['value'] == 25.5
+
+def test_scanner_handles_crlf_and_bom():
+    text = '﻿' + unity_clip.replace('\n', '\r\n')
+    assert scan(text) == parse(text) == parse(unity_clip)
+
+def test_scanner_without_float_curves():
+    text = unity_clip.replace('m_FloatCurves:', 'm_FloatCurves: []\n  m_Unused:')
+    assert scan(text) == parse(text) == []
+
+def test_read_float_curves_falls_back_to_parser():
+    layouts = [
+        # Flow style keys
+        unity_clip.replace('      m_Curve: []', '      m_Curve: [{time: 0, value: 7}]'),
+        # Multi-line plain scalar
+        unity_clip.replace('    path: Body', '    path: Body\n      Part'),
+        # Flow style curve
+        unity_clip.replace('''  - curve:
+      serializedVersion: 2
+      m_Curve: []''', '''  - curve: {serializedVersion: 2, m_Curve: []}
+    m_Unused:
+      m_Curve: []'''),
+        # Anchored value
+        unity_clip.replace('    path: Body', '    path: &body Body'),
+    ]
+    for text in layouts:
+        expected = parse(text)
+        assert unity.read_float_curves(io.BytesIO(text.encode('utf-8')), all_frames=True) == expected
+    assert expected[0].path == 'Body'
+    assert parse(layouts[0])[1].frames == [{'time': 0.0, 'value': 7.0}]
+    assert parse(layouts[1])[0].path == 'Body Part'
+
+def test_written_clips_are_scanned_like_parsed():
+    frames = unity.baked_frames([0, 0.5, 1], [0, 50, 100])
+    clip = unity.make_animation_clip('Clip', [
+        unity.curve('Body', unity.UnityClassID.SKINNED_MESH_RENDERER, 'blendShape.Smile', frames),
+        unity.curve('Body', unity.UnityClassID.SKINNED_MESH_RENDERER, 'blendShape.Empty', []),
+    ])
+    curves = scan(clip)
+    assert curves == parse(clip)
+    assert [f['value'] for f in curves[0].frames] == [0, 50, 100]
+    assert curves[1].frames == []
+
+def test_writer_quotes_names_the_resolver_would_retype():
+    names = ['yes', 'No', '123', '1.5', '~', 'null', '', "it's", 'a: b', '#hash', 'tab\there', ' padded ']
+    curves = [unity.curve(name, unity.UnityClassID.SKINNED_MESH_RENDERER, 'blendShape.' + name, [unity.frame(0, 100)])
+              for name in names]
+    clip = unity.make_animation_clip('yes', curves)
+    assert [c.path for c in scan(clip)] == names
+    assert [c.path for c in parse(clip)] == names
+    document = unity.load_unity_yaml(io.BytesIO(clip.encode('utf-8')))[0]['AnimationClip']
+    assert document['m_Name'] == 'yes'
+    assert [c['path'] for c in document['m_FloatCurves']] == names
+    assert [c['attribute'] for c in document['m_EditorCurves']] == ['blendShape.' + name for name in names]
+
+unity_prefab = '''%YAML 1.1
+%TAG !u! tag:unity3d.com,2011:
+--- !u!1 &100
+GameObject:
+  m_ObjectHideFlags: 0
+  m_Component:
+  - component: {fileID: 400}
+  m_Name: Avatar
+--- !u!4 &400
+Transform:
+  m_GameObject: {fileID: 100}
+  m_Children:
+  - {fileID: 401}
+  m_Father: {fileID: 0}
+--- !u!1 &101
+GameObject:
+  m_Component:
+  - component: {fileID: 401}
+  - component: {fileID: 13700}
+  m_Name: Hat #2
+--- !u!4 &401
+Transform:
+  m_GameObject: {fileID: 101}
+  m_Children:
+  - {fileID: 402}
+  m_Father: {fileID: 400}
+--- !u!137 &13700
+SkinnedMeshRenderer:
+  m_GameObject: {fileID: 101}
+--- !u!1 &102
+GameObject:
+  m_Component:
+  - component: {fileID: 402}
+  - component: {fileID: 13701}
+  m_Name: "Smile \\U0001F600"
+--- !u!4 &402
+Transform:
+  m_GameObject: {fileID: 102}
+  m_Father: {fileID: 401}
+--- !u!137 &13701
+SkinnedMeshRenderer:
+  m_GameObject: {fileID: 102}
+--- !u!1 &103
+GameObject:
+  m_Component:
+  - component: {fileID: 403}
+  m_Name: Long
+    name
+--- !u!4 &403
+Transform:
+  m_GameObject: {fileID: 103}
+  m_Father: {fileID: 402}
+--- !u!4 &600 stripped
+Transform:
+  m_CorrespondingSourceObject: {fileID: 400, guid: 0123456789abcdef0123456789abcdef, type: 3}
+  m_PrefabInstance: {fileID: 700}
+'''
+
+def test_unity_asset(tmp_path):
+    path = tmp_path / 'Avatar.prefab'
+    path.write_text(unity_prefab, encoding='utf-8')
+    asset = unity.UnityAsset(str(path))
+    assert asset.index[13700] == (137, unity_prefab.index('--- !u!137 &13700'))
+    assert sorted(asset.file_ids(unity.UnityClassID.GAME_OBJECT)) == [100, 101, 102, 103]
+    # Names are read the way yaml reads the whole document
+    for file_id in (100, 101, 102, 103):
+        assert asset.game_object_name(file_id) == asset.load(file_id)['m_Name']
+    assert asset.game_object_name(101) == 'Hat'
+    assert asset.game_object_name(102) == 'Smile \U0001F600'
+    assert asset.game_object_name(103) == 'Long name'
+
+    assert asset.game_object_path(100) == 'Avatar'
+    assert asset.game_object_path(103) == 'Avatar/Hat/Smile \U0001F600/Long name'
+    assert asset.game_object_path(103, root=100) == 'Hat/Smile \U0001F600/Long name'
+    assert asset.find_skinned_mesh_renderers('Hat/Smile \U0001F600', root=100) == [13701]
+
+    stripped = asset.load(600)
+    assert stripped['m_PrefabInstance'] == {'fileID': 700}
+    assert stripped['m_CorrespondingSourceObject']['fileID'] == 400
+
+def test_corrupt_sidecars_are_rewritten(tmp_path):
+    clip_path = str(tmp_path / 'Smile.anim')
+    with open(clip_path, 'w', encoding='utf-8') as f:
+        f.write(unity.make_blendshape_anim_clip('Smile', 'Body', {'Smile': 0.5}))
+    for data in (b'', b'PK\x03\x04garbage'):
+        with open(unity.sidecar_path(clip_path), 'wb') as f:
+            f.write(data)
+        assert unity.read_clip_sidecar(clip_path) is None
+        assert unity.load_shape_mix_library(str(tmp_path), max_workers=1, use_sidecars=True) == {'Smile': {'Smile': 0.5}}
+        assert unity.read_clip_sidecar(clip_path) is not None
+
+def translation(x, y, z):
+    m = np.identity(4)
+    m[:3, 3] = (x, y, z)
+    return m
+
+def rotation(axis, degrees):
+    (c, s) = (math.cos(math.radians(degrees)), math.sin(math.radians(degrees)))
+    (i, j) = {'x': (1, 2), 'y': (2, 0), 'z': (0, 1)}[axis]
+    m = np.identity(4)
+    (m[i, i], m[i, j], m[j, i], m[j, j]) = (c, -s, s, c)
+    return m
+
+def test_pose_to_unity_transforms_keeps_bone_axes():
+    # Hips at 0.95 and Spine 10 cm above it, both pointing up (bone Y along
+    # armature Z), as Unity imports them from the FBX exporter: the armature
+    # carries the axis conversion, and bones are only mirrored along X
+    up = rotation('x', 90)
+    rest = np.array([translation(0, 0, 0.95) @ up, translation(0, 0.02, 1.05) @ up])
+    parent_rest = np.array([np.identity(4), rest[0]])
+    basis = np.array([
+        [np.identity(4), np.identity(4)],
+        [translation(0.1, 0, 0), rotation('z', 30)],
+        [np.identity(4), np.diag([2.0, 1, 1, 1])],
+    ])
+    (positions, rotations, scales) = unity.pose_to_unity_transforms(basis, rest, parent_rest)
+    (s45, c45) = (math.sin(math.radians(45)), math.cos(math.radians(45)))
+    (s15, c15) = (math.sin(math.radians(15)), math.cos(math.radians(15)))
+    expected_positions = [
+        [[0, 0, 0.95], [0, 0.1, -0.02]],
+        [[-0.1, 0, 0.95], [0, 0.1, -0.02]],
+        [[0, 0, 0.95], [0, 0.1, -0.02]],
+    ]
+    expected_rotations = [
+        [[s45, 0, 0, c45], [0, 0, 0, 1]],
+        [[s45, 0, 0, c45], [0, 0, -s15, c15]],
+        [[s45, 0, 0, c45], [0, 0, 0, 1]],
+    ]
+    expected_scales = [[[1, 1, 1]] * 2] * 2 + [[[1, 1, 1], [2, 1, 1]]]
+    assert np.allclose(positions, expected_positions)
+    assert np.allclose(rotations, expected_rotations)
+    assert np.allclose(scales, expected_scales)
+
+    (positions, _, _) = unity.pose_to_unity_transforms(basis, rest, parent_rest, unit_scale=0.01)
+    assert np.allclose(positions, np.array(expected_positions) * 0.01)
+
+def test_search_blendshape_limits_by_path(tmp_path):
+    project = tmp_path / 'Assets'
+    project.mkdir()
+    def write(name, value):
+        (project / f'{name}.anim').write_text(
+            unity.make_blendshape_anim_clip(name, 'Body', {'Smile': value, 'Blink': 1}), encoding='utf-8')
+    for (i, name) in enumerate(['c0', 'c1', 'c2']):
+        write(name, i / 10)
+    with unity.open_clip_index(str(project), str(tmp_path / 'index')) as index:
+        assert index.refresh(max_workers=1) == (3, 0, 0)
+        write('c1', 0.5)
+        os.utime(project / 'c1.anim', ns=(0, 1))
+        assert index.refresh(max_workers=1) == (1, 0, 2)
+        matches = index.search_blendshape('smi', limit=2)
+        assert [m.clip_path for m in matches] == ['c0.anim', 'c1.anim']
+        assert matches[0].attributes == ['Smile'] and matches[0].paths == ['Body']
+        assert [m.clip_path for m in index.search_blendshape('Blink', exact=True)] == ['c0.anim', 'c1.anim', 'c2.anim']
+    assert unity.default_clip_index_directory.startswith(unity.user_cache_directory())
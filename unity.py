@@ -1,90 +1,219 @@
-import copy
+import bisect
+import functools
+import hashlib
+import io
+import itertools
+import json
+import math
+import numbers
+import os
+import re
+import sqlite3
+import struct
+import sys
+import tempfile
+import zipfile
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
 from enum import IntEnum
 
+import numpy as np
+
 from . import yaml
 
-# Can pyyaml handle this stuff?
-anim_clip_preamble = '''%YAML 1.1
+unity_yaml_directives = '''%YAML 1.1
 %TAG !u! tag:unity3d.com,2011:
---- !u!74 &7400000
 '''
 
-def make_animation_clip(name, curves):
-    return anim_clip_preamble + yaml.dump({
-        'AnimationClip': {
-            'm_Name': name,
-            'm_FloatCurves': curves,
-            'm_EditorCurves': copy.deepcopy(curves),
-            'm_ObjectHideFlags': 0,
-            'm_CorrespondingSourceObject': {'fileID': 0},
-            'm_PrefabInstance': {'fileID': 0},
-            'm_PrefabAsset': {'fileID': 0},
-            'serializedVersion': 6,
-            'm_Legacy': 0,
-            'm_Compressed': 0,
-            'm_UseHighQualityCurve': 1,
-            'm_RotationCurves': [],
-            'm_CompressedRotationCurves': [],
-            'm_EulerCurves': [],
-            'm_PositionCurves': [],
-            'm_ScaleCurves': [],
-            'm_PPtrCurves': [],
-            'm_SampleRate': 60,
-            'm_WrapMode': 0,
-            'm_Bounds': {
-                'm_Center': {'x': 0, 'y': 0, 'z': 0},
-                'm_Extent': {'x': 0, 'y': 0, 'z': 0}
-            },
-            'm_AnimationClipSettings': {
-                'serializedVersion': 2,
-                'm_AdditiveReferencePoseClip': {'fileID': 0},
-                'm_AdditiveReferencePoseTime': 0,
-                'm_StartTime': 0,
-                'm_StopTime': 0.016666668,
-                'm_OrientationOffsetY': 0,
-                'm_Level': 0,
-                'm_CycleOffset': 0,
-                'm_HasAdditiveReferencePose': 0,
-                'm_LoopTime': 1,
-                'm_LoopBlend': 0,
-                'm_LoopBlendOrientation': 0,
-                'm_LoopBlendPositionY': 0,
-                'm_LoopBlendPositionXZ': 0,
-                'm_KeepOriginalOrientation': 0,
-                'm_KeepOriginalPositionY': 1,
-                'm_KeepOriginalPositionXZ': 0,
-                'm_HeightFromFeet': 0,
-                'm_Mirror': 0,
-            },
-            'm_EulerEditorCurves': [],
-            'm_HasGenericRootTransform': 0,
-            'm_HasMotionFloatCurves': 0,
-            'm_Events': []
-        }
+anim_clip_preamble = unity_yaml_directives + '--- !u!74 &7400000\n'
+
+# Everything but the name and the curve lists is fixed, so clips are written
+# from pre-rendered text. Each float curve is rendered once and the same text
+# is written to both m_FloatCurves and m_EditorCurves.
+_clip_header = '''AnimationClip:
+  m_ObjectHideFlags: 0
+  m_CorrespondingSourceObject: {fileID: 0}
+  m_PrefabInstance: {fileID: 0}
+  m_PrefabAsset: {fileID: 0}
+  m_Name: %(name)s
+  serializedVersion: 6
+  m_Legacy: 0
+  m_Compressed: 0
+  m_UseHighQualityCurve: 1
+  m_RotationCurves:%(rotation_curves)s
+  m_CompressedRotationCurves: []
+  m_EulerCurves: []
+  m_PositionCurves:%(position_curves)s
+  m_ScaleCurves:%(scale_curves)s
+  m_FloatCurves:'''
+
+_clip_settings = '''
+  m_PPtrCurves: []
+  m_SampleRate: %(sample_rate)s
+  m_WrapMode: 0
+  m_Bounds:
+    m_Center: {x: 0, y: 0, z: 0}
+    m_Extent: {x: 0, y: 0, z: 0}
+  m_AnimationClipSettings:
+    serializedVersion: 2
+    m_AdditiveReferencePoseClip: {fileID: 0}
+    m_AdditiveReferencePoseTime: 0
+    m_StartTime: 0
+    m_StopTime: %(stop_time)s
+    m_OrientationOffsetY: 0
+    m_Level: 0
+    m_CycleOffset: 0
+    m_HasAdditiveReferencePose: 0
+    m_LoopTime: 1
+    m_LoopBlend: 0
+    m_LoopBlendOrientation: 0
+    m_LoopBlendPositionY: 0
+    m_LoopBlendPositionXZ: 0
+    m_KeepOriginalOrientation: 0
+    m_KeepOriginalPositionY: 1
+    m_KeepOriginalPositionXZ: 0
+    m_HeightFromFeet: 0
+    m_Mirror: 0
+  m_EditorCurves:'''
+
+_clip_footer = '''
+  m_EulerEditorCurves: []
+  m_HasGenericRootTransform: 0
+  m_HasMotionFloatCurves: 0
+  m_Events: []
+'''
+
+_plain_string = re.compile(r'[A-Za-z_][A-Za-z0-9_ .()/-]*')
+_string_resolver = yaml.resolver.Resolver()
+
+@functools.lru_cache(maxsize=4096)
+def _format_string(value):
+    is_plain = (_plain_string.fullmatch(value) and not value.endswith(' ') and
+        _string_resolver.resolve(yaml.ScalarNode, value, (True, False)) == 'tag:yaml.org,2002:str')
+    if is_plain:
+        return value
+    if any(c < ' ' or c == '\x7f' for c in value):
+        return json.dumps(value, ensure_ascii=False)
+    return "'" + value.replace("'", "''") + "'"
+
+# Shortest representation that survives a round trip through single
+# precision, as written by Unity
+def _format_float32(value):
+    value32 = struct.unpack('f', struct.pack('f', value))[0]
+    for precision in range(6, 10):
+        text = '%.*g' % (precision, value32)
+        if struct.unpack('f', struct.pack('f', float(text)))[0] == value32:
+            return text
+    return text
+
+def _format_scalar(value):
+    if isinstance(value, int) or (isinstance(value, numbers.Integral) and not isinstance(value, float)):
+        return str(int(value))
+    if isinstance(value, str):
+        return _format_string(value)
+    if isinstance(value, dict):
+        return '{' + ', '.join(f'{k}: {_format_scalar(v)}' for k, v in value.items()) + '}'
+    if isinstance(value, list):
+        return '[' + ', '.join(_format_scalar(v) for v in value) + ']'
+    value = float(value)
+    if value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    if math.isinf(value):
+        return 'Infinity' if value > 0 else '-Infinity'
+    if math.isnan(value):
+        return 'NaN'
+    # Unity curves are single precision, so long representations are noise
+    text = repr(value)
+    return text if len(text) <= 10 else _format_float32(value)
+
+def _render_frame(frame):
+    return '      - ' + '\n        '.join(f'{k}: {_format_scalar(v)}' for k, v in frame.items())
+
+# Blocks start with a newline and have none at the end, like the template
+# sections they are written between
+def _render_curve(curve):
+    lines = ['  - curve:']
+    for key, value in curve['curve'].items():
+        if key == 'm_Curve' and value:
+            lines.append('      m_Curve:')
+            lines.extend(_render_frame(frame) for frame in value)
+        else:
+            lines.append(f'      {key}: {_format_scalar(value)}')
+    lines.extend(f'    {key}: {_format_scalar(value)}' for key, value in curve.items() if key != 'curve')
+    return '\n' + '\n'.join(lines)
+
+def _write_curves(f, curve_blocks):
+    if curve_blocks:
+        f.writelines(curve_blocks)
+    else:
+        f.write(' []')
+
+def _render_curves(curves):
+    return ''.join(map(_render_curve, curves)) or ' []'
+
+# The editor shows each component of a transform curve as a float curve
+def _component_curves(transform_curves, attribute):
+    for c in transform_curves:
+        frames = c['curve']['m_Curve']
+        for component in frames[0]['value']:
+            yield curve(c['path'], UnityClassID.TRANSFORM, f'{attribute}.{component}',
+                        [frame(k['time'], k['value'][component], k['inSlope'][component], k['outSlope'][component], k['tangentMode'])
+                         for k in frames])
+
+# Single frame clips default to lasting one sample
+def write_animation_clip(f, name, curves, sample_rate=60, stop_time=None, rotation_curves=(), position_curves=(), scale_curves=()):
+    if stop_time is None:
+        stop_time = 1 / sample_rate
+    curve_blocks = [_render_curve(curve) for curve in curves]
+    editor_curve_blocks = curve_blocks + [_render_curve(curve) for curve in itertools.chain(
+        _component_curves(position_curves, 'm_LocalPosition'),
+        _component_curves(rotation_curves, 'm_LocalRotation'),
+        _component_curves(scale_curves, 'm_LocalScale'))]
+    f.write(anim_clip_preamble)
+    f.write(_clip_header % {
+        'name': _format_string(name),
+        'rotation_curves': _render_curves(rotation_curves),
+        'position_curves': _render_curves(position_curves),
+        'scale_curves': _render_curves(scale_curves),
     })
+    _write_curves(f, curve_blocks)
+    f.write(_clip_settings % {'sample_rate': _format_scalar(sample_rate), 'stop_time': _format_float32(stop_time)})
+    _write_curves(f, editor_curve_blocks)
+    f.write(_clip_footer)
+
+def make_animation_clip(name, curves, sample_rate=60, stop_time=None, rotation_curves=(), position_curves=(), scale_curves=()):
+    f = io.StringIO()
+    write_animation_clip(f, name, curves, sample_rate, stop_time, rotation_curves, position_curves, scale_curves)
+    return f.getvalue()
+
+default_weight = 0.33333334
 
-def frame(time, value):
+# Vector and quaternion keys have dicts of components for the value, slopes
+# and weights
+def frame(time, value, in_slope=0, out_slope=0, tangent_mode=136, weight=default_weight):
     return {
         'serializedVersion': 3,
         'time': time,
         'value': value,
-        'inSlope': 0,
-        'outSlope': 0,
-        'tangentMode': 136,
+        'inSlope': in_slope,
+        'outSlope': out_slope,
+        'tangentMode': tangent_mode,
         'weightedMode': 0,
-        'inWeight': 0.33333334,
-        'outWeight': 0.33333334,
+        'inWeight': weight,
+        'outWeight': weight,
     }
 
 class UnityClassID(IntEnum):
     GAME_OBJECT = 1
+    TRANSFORM = 4
     SKINNED_MESH_RENDERER = 137
 
-def curve(path, class_id, attribute, value):
+def curve(path, class_id, attribute, frames):
     return {
         'curve': {
             'serializedVersion': 2,
-            'm_Curve': [frame(0, value)],
+            'm_Curve': frames,
             'm_PreInfinity': 2,
             'm_PostInfinity': 2,
             'm_RotationOrder': 4
@@ -95,6 +224,19 @@ def curve(path, class_id, attribute, value):
         'script': {'fileID': 0}
     }
 
+# Position, rotation and scale curves have no attribute or class
+def transform_curve(path, frames):
+    return {
+        'curve': {
+            'serializedVersion': 2,
+            'm_Curve': frames,
+            'm_PreInfinity': 2,
+            'm_PostInfinity': 2,
+            'm_RotationOrder': 4
+        },
+        'path': path,
+    }
+
 def make_blendshape_anim_clip(name, path, shape_keys):
     # Unity blendshape values are integers in range 0-100
     def blendshape_value(blender_value):
@@ -105,51 +247,1061 @@ def make_blendshape_anim_clip(name, path, shape_keys):
         path,
         UnityClassID.SKINNED_MESH_RENDERER,
         'blendShape.' + name,
-        blendshape_value(value))
+        [frame(0, blendshape_value(value))])
 
     curves = [blendshape_curve(name, value) for name, value in shape_keys.items()]
     return make_animation_clip(name, curves)
 
+# Tangent mode "free" on both sides, so that the editor keeps the baked slopes
+baked_tangent_mode = 0
+
+# Tangent mode "linear" on both sides, broken, for keys of reduced curves
+linear_tangent_mode = 69
+
+# Returns the indices of the keys to keep so that linear interpolation
+# between them stays within tolerance of every sample. Constant runs are
+# collapsed first, then the remaining keys are simplified with
+# Ramer-Douglas-Peucker, measuring the error along the value axis. Values
+# with several components per sample are reduced together, by their largest
+# error.
+def reduce_keyframes(times, values, tolerance):
+    n = len(values)
+    if n == 0:
+        return np.arange(0)
+    values = values.reshape(n, -1)
+    if np.ptp(values, axis=0).max() <= tolerance:
+        return np.arange(1)
+    if n == 2:
+        return np.arange(2)
+
+    changes = np.empty(n, dtype=bool)
+    changes[0] = changes[-1] = True
+    ((values[1:-1] != values[:-2]) | (values[1:-1] != values[2:])).any(axis=1, out=changes[1:-1])
+    candidates = np.flatnonzero(changes)
+
+    keep = np.zeros(len(candidates), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(candidates) - 1)]
+    while stack:
+        (a, b) = stack.pop()
+        if b - a < 2:
+            continue
+        (ia, ib) = (candidates[a], candidates[b])
+        interior = candidates[a + 1:b]
+        slope = (values[ib] - values[ia]) / (times[ib] - times[ia])
+        errors = np.abs(values[interior] - (values[ia] + (times[interior] - times[ia])[:, None] * slope)).max(axis=1)
+        worst = int(np.argmax(errors))
+        if errors[worst] > tolerance:
+            split = a + 1 + worst
+            keep[split] = True
+            stack.append((a, split))
+            stack.append((split, b))
+    return candidates[keep]
+
+# times are in seconds, values are arrays of samples at those times. With a
+# tolerance, keys are reduced and joined by linear segments, so the error
+# stays within tolerance between the original samples too. With components,
+# such as 'xyz', values have one column per component and the keys have
+# vector values.
+def baked_frames(times, values, tolerance=0, components=None):
+    times = np.asarray(times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    if tolerance > 0:
+        kept = reduce_keyframes(times, values, tolerance)
+        (times, values) = (times[kept], values[kept])
+        segment_slopes = np.diff(values, axis=0) / np.diff(times).reshape((-1,) + (1,) * (values.ndim - 1))
+        zero = np.zeros_like(values[:1])
+        in_slopes = np.concatenate((zero, segment_slopes))
+        out_slopes = np.concatenate((segment_slopes, zero))
+        tangent_mode = linear_tangent_mode
+    else:
+        if len(times) > 1:
+            in_slopes = out_slopes = np.gradient(values, times, axis=0)
+        else:
+            in_slopes = out_slopes = np.zeros_like(values)
+        tangent_mode = baked_tangent_mode
+    if components is None:
+        return [frame(t, v, i, o, tangent_mode)
+                for (t, v, i, o) in zip(times.tolist(), values.tolist(), in_slopes.tolist(), out_slopes.tolist())]
+    weight = dict.fromkeys(components, default_weight)
+    return [frame(t, dict(zip(components, v)), dict(zip(components, i)), dict(zip(components, o)), tangent_mode, weight)
+            for (t, v, i, o) in zip(times.tolist(), values.tolist(), in_slopes.tolist(), out_slopes.tolist())]
+
+# shape_key_curves maps shape key names to (times, values) samples, with
+# times in seconds and values and tolerance in the Blender range 0-1
+def make_baked_blendshape_anim_clip(name, path, shape_key_curves, sample_rate, stop_time, tolerance=0):
+    curves = [curve(path, UnityClassID.SKINNED_MESH_RENDERER, 'blendShape.' + key_name, baked_frames(times, np.asarray(values) * 100, tolerance * 100))
+              for key_name, (times, values) in shape_key_curves.items()]
+    return make_animation_clip(name, curves, sample_rate, stop_time)
+
+# Blender is right-handed and Unity left-handed. The FBX exporter only
+# converts the axes of top-level objects, such as the armature, so bones keep
+# Blender's axes and are only mirrored along X when Unity imports them.
+blender_to_unity_handedness = np.diag([-1.0, 1.0, 1.0])
+
+# Rotation matrices of shape (..., 3, 3) to (x, y, z, w) quaternions. Each
+# row of candidates is a quaternion scaled by four times one of its
+# components, and the one with the largest component is the most accurate.
+def rotation_matrices_to_quaternions(m):
+    (m00, m01, m02) = (m[..., 0, 0], m[..., 0, 1], m[..., 0, 2])
+    (m10, m11, m12) = (m[..., 1, 0], m[..., 1, 1], m[..., 1, 2])
+    (m20, m21, m22) = (m[..., 2, 0], m[..., 2, 1], m[..., 2, 2])
+    t = 1 + np.stack([m00 + m11 + m22, m00 - m11 - m22, m11 - m00 - m22, m22 - m00 - m11], axis=-1)
+    candidates = np.stack([
+        np.stack([m21 - m12, m02 - m20, m10 - m01, t[..., 0]], axis=-1),
+        np.stack([t[..., 1], m01 + m10, m02 + m20, m21 - m12], axis=-1),
+        np.stack([m01 + m10, t[..., 2], m12 + m21, m02 - m20], axis=-1),
+        np.stack([m02 + m20, m12 + m21, t[..., 3], m10 - m01], axis=-1),
+    ], axis=-2)
+    case = np.argmax(t, axis=-1)[..., None]
+    q = np.take_along_axis(candidates, case[..., None], axis=-2)[..., 0, :]
+    return q / (2 * np.sqrt(np.take_along_axis(t, case, axis=-1)))
+
+# basis has shape (frames, bones, 4, 4) and holds the pose bones'
+# matrix_basis, rest and parent_rest have shape (bones, 4, 4) and hold the
+# bones' matrix_local, with the identity for bones without a parent. Returns
+# Unity local positions, scaled by unit_scale, (x, y, z, w) rotations and
+# scales, each of shape (frames, bones, components), with quaternion signs
+# kept continuous over time.
+def pose_to_unity_transforms(basis, rest, parent_rest, unit_scale=1):
+    local = (np.linalg.inv(parent_rest) @ rest)[None] @ basis
+    c = blender_to_unity_handedness
+    linear = c @ local[..., :3, :3] @ c
+    positions = local[..., :3, 3] @ c * unit_scale
+    scales = np.linalg.norm(linear, axis=-2)
+    scales[..., 0] *= np.where(np.linalg.det(linear) < 0, -1, 1)
+    # Bones scaled to zero, e.g. to hide them, keep an arbitrary rotation
+    rotations = rotation_matrices_to_quaternions(linear / np.where(scales == 0, 1, scales)[..., None, :])
+    flips = np.einsum('...i,...i->...', rotations[1:], rotations[:-1]) < 0
+    signs = np.cumprod(np.where(flips, -1, 1), axis=0)
+    rotations[1:] *= signs[..., None]
+    return (positions, rotations, scales)
+
+# Transform samples have shape (frames, bones, components), as returned by
+# pose_to_unity_transforms, with times in seconds. Positions are reduced with
+# position_tolerance, which defaults to tolerance.
+def make_transform_anim_clip(name, paths, times, positions, rotations, scales, sample_rate, stop_time, tolerance=0, position_tolerance=None):
+    if position_tolerance is None:
+        position_tolerance = tolerance
+    position_curves = [transform_curve(path, baked_frames(times, positions[:, i], position_tolerance, 'xyz')) for i, path in enumerate(paths)]
+    rotation_curves = [transform_curve(path, baked_frames(times, rotations[:, i], tolerance, 'xyzw')) for i, path in enumerate(paths)]
+    scale_curves = [transform_curve(path, baked_frames(times, scales[:, i], tolerance, 'xyz')) for i, path in enumerate(paths)]
+    return make_animation_clip(name, [], sample_rate, stop_time, rotation_curves, position_curves, scale_curves)
+
 def make_toggle_anim_clip(name, paths, is_active):
     value = 1 if is_active else 0
-    curves = [curve(path, UnityClassID.GAME_OBJECT, 'm_IsActive', value) for path in paths]
+    curves = [curve(path, UnityClassID.GAME_OBJECT, 'm_IsActive', [frame(0, value)]) for path in paths]
     return make_animation_clip(name, curves)
 
-def anim_clip_to_shape_mix(anim_clip_src, path):
-    anim_clip = yaml.safe_load(anim_clip_src)
-    curves = anim_clip['AnimationClip']['m_FloatCurves']
-    shape_mix = {}
+def _write_toggle_anim_clip(job):
+    (file_path, name, paths, is_active) = job
+    return write_if_changed(file_path, make_toggle_anim_clip(name, paths, is_active))
+
+# Jobs are (file path, clip name, object paths, is_active) tuples. Rendering
+# holds the GIL, but comparing and writing the files does not, which is where
+# most of the time goes for small clips. Returns the number of files written.
+def write_toggle_anim_clips(jobs, max_workers=None):
+    if max_workers is None:
+        max_workers = min(8, os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers) as executor:
+        return sum(executor.map(_write_toggle_anim_clip, jobs))
+
+def _file_digest(path, size):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(functools.partial(f.read, 1 << 20), b''):
+            digest.update(chunk)
+            if f.tell() > size:
+                return None
+    return digest.digest()
+
+# Leaves the file untouched when it already has this content, so that Unity
+# does not reimport it. Returns whether the file was written.
+def write_if_changed(path, text):
+    data = text.encode('utf-8')
+    try:
+        if os.path.getsize(path) == len(data) and _file_digest(path, len(data)) == hashlib.sha1(data).digest():
+            return False
+    except OSError:
+        pass
+    # Not mkstemp, which would create the file without group/other permissions
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+    return True
+
+# Unity files start with %YAML/%TAG directives and give every document a
+# "--- !u!<classID> &<fileID>" header, so they can be fed to yaml unmodified
+# as long as the unity3d.com tags have a constructor
+class UnityLoader(yaml.SafeLoader):
+    pass
+
+def _construct_unity_object(loader, tag_suffix, node):
+    return loader.construct_mapping(node, deep=True)
+
+UnityLoader.add_multi_constructor('tag:unity3d.com,2011:', _construct_unity_object)
+
+# Accepts a path or an already open (preferably binary) stream. Binary
+# streams let the yaml Reader decode the file in chunks.
+@contextmanager
+def open_unity_file(source):
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            yield f
+    else:
+        yield source
+
+def load_unity_yaml(source):
+    with open_unity_file(source) as f:
+        return list(yaml.load_all(f, Loader=UnityLoader))
+
+FloatCurve = namedtuple('FloatCurve', ['path', 'attribute', 'class_id', 'frames'])
+
+_int_frame_fields = {'serializedVersion', 'tangentMode', 'weightedMode'}
+
+# The pure-Python yaml scanner is far too slow for large clips, so
+# m_FloatCurves is first read with a line scanner for the block layout written
+# by Unity (and by this addon). Anything outside that layout falls back to the
+# yaml event stream, which skips every subtree other than m_FloatCurves
+# without constructing it.
+
+class _UnsupportedLayout(Exception):
+    pass
+
+def _scan_scalar(value):
+    if not value:
+        return value
+    if value[0] == "'":
+        if len(value) < 2 or value[-1] != "'":
+            raise _UnsupportedLayout(value)
+        return value[1:-1].replace("''", "'")
+    if value[0] == '"':
+        try:
+            return json.loads(value)
+        except ValueError:
+            raise _UnsupportedLayout(value)
+    if value[0] in '&*!|>{[%@`' or ' #' in value:
+        raise _UnsupportedLayout(value)
+    return value
+
+def _scan_key_value(content):
+    (key, sep, value) = content.partition(':')
+    if not sep or (value and value[0] != ' ') or key[:1] in '\'"':
+        raise _UnsupportedLayout(content)
+    return (key, value.strip())
+
+def _scan_float_curves(lines, all_frames):
+    for line in lines:
+        content = line.strip()
+        if content == 'm_FloatCurves: []':
+            return []
+        if content == 'm_FloatCurves:':
+            list_indent = len(line) - len(line.lstrip(' '))
+            break
+    else:
+        return []
+
+    # Sequences are indentless in both Unity and PyYAML output, so each curve
+    # starts with a dash at the indentation of the m_FloatCurves key
+    item_indent = list_indent + 2
+    curve_indent = item_indent + 2
+    curves = []
+    fields = None
+    for line in lines:
+        content = line.strip()
+        if not content:
+            continue
+        indent = len(line) - len(line.lstrip(' '))
+        if indent < list_indent or (indent == list_indent and not content.startswith('- ')):
+            break
+        if indent == list_indent:
+            if fields is not None:
+                curves.append(FloatCurve(fields['path'], fields['attribute'], int(fields['classID']), frames))
+            fields = {'path': '', 'attribute': '', 'classID': '0'}
+            frames = []
+            in_curve = in_keyframes = False
+            content = content[2:]
+            indent = item_indent
+        if indent == item_indent:
+            (key, value) = _scan_key_value(content)
+            if key == 'curve' and value:
+                raise _UnsupportedLayout(content)
+            in_curve = key == 'curve'
+            in_keyframes = False
+            if key in fields:
+                fields[key] = _scan_scalar(value)
+        elif in_curve and indent == curve_indent and not content.startswith('- '):
+            (key, value) = _scan_key_value(content)
+            # Only empty flow sequences, as written for curves without keys
+            if key == 'm_Curve' and value not in ('', '[]'):
+                raise _UnsupportedLayout(content)
+            in_keyframes = key == 'm_Curve' and not value
+            frame_indent = frame = None
+        elif in_keyframes:
+            if content.startswith('- ') and frame_indent in (None, indent):
+                frame_indent = indent
+                frame = {} if all_frames or not frames else None
+                if frame is not None:
+                    frames.append(frame)
+                content = content[2:]
+                indent += 2
+            if frame is not None and indent == frame_indent + 2:
+                (key, value) = _scan_key_value(content)
+                frame[key] = int(value) if key in _int_frame_fields else float(value)
+        elif indent > item_indent and ':' not in content:
+            # Continuation of a multi-line scalar
+            raise _UnsupportedLayout(content)
+    if fields is not None:
+        curves.append(FloatCurve(fields['path'], fields['attribute'], int(fields['classID']), frames))
+    return curves
+
+def _skip_node(events, event):
+    if isinstance(event, yaml.CollectionStartEvent):
+        depth = 1
+        while depth:
+            event = next(events)
+            if isinstance(event, yaml.CollectionStartEvent):
+                depth += 1
+            elif isinstance(event, yaml.CollectionEndEvent):
+                depth -= 1
+
+# Yields (key, value event) pairs; the caller must consume each value
+# before asking for the next pair
+def _mapping_items(events):
+    while True:
+        event = next(events)
+        if isinstance(event, yaml.MappingEndEvent):
+            return
+        yield event.value, next(events)
+
+def _read_frame(events):
+    frame = {}
+    for key, event in _mapping_items(events):
+        if isinstance(event, yaml.ScalarEvent):
+            frame[key] = int(event.value) if key in _int_frame_fields else float(event.value)
+        else:
+            _skip_node(events, event)
+    return frame
+
+def _read_frames(events, all_frames):
+    frames = []
+    while True:
+        event = next(events)
+        if isinstance(event, yaml.SequenceEndEvent):
+            return frames
+        if isinstance(event, yaml.MappingStartEvent) and (all_frames or not frames):
+            frames.append(_read_frame(events))
+        else:
+            _skip_node(events, event)
+
+def _read_float_curve(events, all_frames):
+    fields = {'path': '', 'attribute': '', 'classID': '0'}
+    frames = []
+    for key, event in _mapping_items(events):
+        if key == 'curve' and isinstance(event, yaml.MappingStartEvent):
+            for curve_key, curve_event in _mapping_items(events):
+                if curve_key == 'm_Curve' and isinstance(curve_event, yaml.SequenceStartEvent):
+                    frames = _read_frames(events, all_frames)
+                else:
+                    _skip_node(events, curve_event)
+        elif key in fields and isinstance(event, yaml.ScalarEvent):
+            fields[key] = event.value
+        else:
+            _skip_node(events, event)
+    return FloatCurve(fields['path'], fields['attribute'], int(fields['classID']), frames)
+
+def _parse_float_curves(stream, all_frames):
+    curves = []
+    events = yaml.parse(stream, Loader=UnityLoader)
+    for event in events:
+        if not isinstance(event, yaml.MappingStartEvent):
+            continue
+        for class_name, clip_event in _mapping_items(events):
+            if class_name != 'AnimationClip' or not isinstance(clip_event, yaml.MappingStartEvent):
+                _skip_node(events, clip_event)
+                continue
+            for key, value_event in _mapping_items(events):
+                if key != 'm_FloatCurves' or not isinstance(value_event, yaml.SequenceStartEvent):
+                    _skip_node(events, value_event)
+                    continue
+                for curve_event in events:
+                    if isinstance(curve_event, yaml.SequenceEndEvent):
+                        break
+                    if isinstance(curve_event, yaml.MappingStartEvent):
+                        curves.append(_read_float_curve(events, all_frames))
+                    else:
+                        _skip_node(events, curve_event)
+    return curves
+
+_document_header = re.compile(rb'--- !u!(\d+) &(-?\d+)')
+
+# Names the scanner doesn't handle, like plain scalars with comments or
+# escapes that JSON lacks, are read as yaml. Returns None when the line alone
+# is not valid, e.g. for quoted names continued on the next line.
+def _scan_name(value):
+    try:
+        return _scan_scalar(value)
+    except _UnsupportedLayout:
+        pass
+    try:
+        name = yaml.safe_load(value)
+    except yaml.YAMLError:
+        return None
+    return '' if name is None else str(name)
+
+# Multi-document Unity files (.prefab, .controller, .unity) with one document
+# per object. Indexing only looks at document headers, recording each
+# object's byte offset; documents are parsed individually when requested.
+class UnityAsset:
+    def __init__(self, path):
+        self.path = path
+        self._index = None
+        self._offsets = None
+        self._names = None
+        self._objects = {}
+
+    def _build_index(self):
+        index = {}
+        names = {}
+        offset = 0
+        current = None
+        named = None
+        with open(self.path, 'rb') as f:
+            for line in f:
+                # Names continued on the next line are read with their document
+                if named is not None and line.startswith(b'   '):
+                    del names[named]
+                named = None
+                if line.startswith(b'--- '):
+                    match = _document_header.match(line)
+                    current = None
+                    if match:
+                        (class_id, file_id) = (int(match[1]), int(match[2]))
+                        index[file_id] = (class_id, offset)
+                        if class_id == UnityClassID.GAME_OBJECT:
+                            current = file_id
+                elif current is not None and line.startswith(b'  m_Name: '):
+                    name = _scan_name(line[10:].decode('utf-8').strip())
+                    if name is not None:
+                        names[current] = name
+                        named = current
+                    current = None
+                offset += len(line)
+        self._index = index
+        self._offsets = sorted(offset for (_, offset) in index.values()) + [offset]
+        self._names = names
+
+    # fileID -> (classID, byte offset)
+    @property
+    def index(self):
+        if self._index is None:
+            self._build_index()
+        return self._index
+
+    def file_ids(self, class_id=None):
+        return [file_id for file_id, (c, _) in self.index.items() if class_id is None or c == class_id]
+
+    def load(self, file_id):
+        if file_id not in self._objects:
+            (_, offset) = self.index[file_id]
+            end = self._offsets[bisect.bisect_right(self._offsets, offset)]
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                data = f.read(end - offset)
+            # Prefab instance placeholders are marked "stripped" after the anchor
+            (header, newline, body) = data.partition(b'\n')
+            header = header.replace(b' stripped', b'')
+            document = yaml.load(unity_yaml_directives.encode() + header + newline + body, Loader=UnityLoader)
+            self._objects[file_id] = next(iter(document.values())) if document else {}
+        return self._objects[file_id]
+
+    def game_object_name(self, file_id):
+        if self._names is None:
+            self._build_index()
+        if file_id not in self._names and file_id in self._index:
+            name = self.load(file_id).get('m_Name')
+            self._names[file_id] = '' if name is None else str(name)
+        return self._names.get(file_id)
+
+    # Path of a GameObject as used by animation clips: relative to root (a
+    # GameObject fileID), or starting at the top-level object
+    def game_object_path(self, file_id, root=None):
+        game_object = self.load(file_id)
+        transform_id = game_object['m_Component'][0]['component']['fileID']
+        names = []
+        while transform_id:
+            transform = self.load(transform_id)
+            game_object_id = transform.get('m_GameObject', {}).get('fileID', 0)
+            if game_object_id == root:
+                break
+            names.append(self.game_object_name(game_object_id))
+            transform_id = transform.get('m_Father', {}).get('fileID', 0)
+        return '/'.join(reversed(names))
+
+    def find_skinned_mesh_renderers(self, path, root=None):
+        return [file_id for file_id in self.file_ids(UnityClassID.SKINNED_MESH_RENDERER)
+                if self.game_object_path(self.load(file_id)['m_GameObject']['fileID'], root) == path]
+
+def _scan_unity_file(f, all_frames):
+    if isinstance(f, io.TextIOBase):
+        return _scan_float_curves(f, all_frames)
+    text = io.TextIOWrapper(f, encoding='utf-8-sig')
+    try:
+        return _scan_float_curves(text, all_frames)
+    finally:
+        text.detach()
+
+# Whether the line scanner reads the same curves as the yaml parser. Clips it
+# doesn't understand are still read correctly by read_float_curves, only
+# slower.
+def scanner_matches_parser(source, all_frames=True):
+    with open_unity_file(source) as f:
+        start = f.tell()
+        try:
+            scanned = _scan_unity_file(f, all_frames)
+        except (_UnsupportedLayout, ValueError):
+            return False
+        f.seek(start)
+        return scanned == _parse_float_curves(f, all_frames)
+
+def read_float_curves(source, all_frames=False):
+    with open_unity_file(source) as f:
+        start = f.tell()
+        try:
+            return _scan_unity_file(f, all_frames)
+        except (_UnsupportedLayout, ValueError):
+            f.seek(start)
+            return _parse_float_curves(f, all_frames)
+
+# LRU cache of parsed clips, keyed by absolute path and validated against
+# the file's size and mtime. Entries are also saved as arrays to an optional
+# cache directory so they survive restarts and are shared with worker
+# processes. Entries are plain .npz archives, loaded without pickle, since
+# the directory could be written by someone else.
+class ClipCache:
+    def __init__(self, max_entries=64, directory=None, max_disk_size=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.max_disk_size = max_disk_size
+        self._entries = OrderedDict()
+
+    def clear(self):
+        self._entries.clear()
+
+    def float_curves(self, clip_path, all_frames=False):
+        clip_path = os.path.abspath(clip_path)
+        st = os.stat(clip_path)
+        stamp = (st.st_size, st.st_mtime_ns)
+
+        # Full curve data also satisfies first-frame requests
+        for key in {(clip_path, True), (clip_path, all_frames)}:
+            entry = self._entries.get(key)
+            if entry and entry[0] == stamp:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        key = (clip_path, all_frames)
+        curves = self._read_disk_entry(key, stamp)
+        if curves is None:
+            curves = read_float_curves(clip_path, all_frames)
+            self._write_disk_entry(key, stamp, curves)
+
+        self._entries[key] = (stamp, curves)
+        self.trim()
+        return curves
+
+    def trim(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _disk_entry_path(self, key):
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest + '.npz')
+
+    def _read_disk_entry(self, key, stamp):
+        if not self.directory:
+            return None
+        entry_path = self._disk_entry_path(key)
+        try:
+            with np.load(entry_path) as archive:
+                if (str(archive['clip_path']) != key[0] or bool(archive['all_frames']) != key[1]
+                        or archive['stamp'].tolist() != list(stamp)):
+                    return None
+                curves = arrays_to_float_curves(ClipArrays(**{name: archive[name] for name in ClipArrays._fields}))
+            # Touch the entry so the disk cache is trimmed in LRU order
+            os.utime(entry_path)
+        except (OSError, KeyError, ValueError, EOFError, zipfile.BadZipFile):
+            # Another process may have trimmed the entry meanwhile
+            return None
+        return curves
+
+    def _write_disk_entry(self, key, stamp, curves):
+        if not self.directory:
+            return
+        # Double precision keeps values as parsed, and curves that don't
+        # survive the conversion, like keys missing fields, are not saved
+        arrays = float_curves_to_arrays(curves, np.float64)
+        if arrays_to_float_curves(arrays) != curves:
+            return
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        entry_path = self._disk_entry_path(key)
+        (fd, temp_path) = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, clip_path=key[0], all_frames=key[1], stamp=np.array(stamp, dtype=np.int64), **arrays._asdict())
+        os.replace(temp_path, entry_path)
+        self._trim_disk()
+
+    def _trim_disk(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npz'):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime_ns, st.st_size, entry.path))
+        total_size = sum(size for (_, size, _) in entries)
+        for (_, size, entry_path) in sorted(entries):
+            if total_size <= self.max_disk_size:
+                break
+            try:
+                os.remove(entry_path)
+            except OSError:
+                pass
+            total_size -= size
+
+# Per user, so that other users can't plant entries
+def user_cache_directory():
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~/AppData/Local')
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'jA_cOp_Tools')
+
+default_clip_cache_directory = os.path.join(user_cache_directory(), 'clip_cache')
+
+clip_cache = ClipCache()
+
+def _init_worker_clip_cache(directory, max_disk_size):
+    clip_cache.directory = directory
+    clip_cache.max_disk_size = max_disk_size
+
+# Maps shape key names to the frames of each blendshape curve, optionally
+# only for curves with a matching object path
+def blendshape_curves(curves, path):
+    shape_key_frames = {}
     for curve in curves:
-        components = curve['attribute'].split('.')
+        components = curve.attribute.split('.')
         if len(components) == 2:
-            frames = curve['curve']['m_Curve']
+            frames = curve.frames
             (attribute_type, attribute_name) = components
-            is_path_match = not path or curve['path'] == path
+            is_path_match = not path or curve.path == path
             if frames and attribute_type =='blendShape' and is_path_match:
-                first_frame = frames[0]
-                shape_mix[attribute_name] = float(first_frame['value']) / 100
+                shape_key_frames[attribute_name] = frames
+    return shape_key_frames
+
+def anim_clip_to_shape_mix(source, path):
+    if isinstance(source, (str, os.PathLike)):
+        curves = clip_cache.float_curves(source)
+    else:
+        curves = read_float_curves(source)
+
+    shape_mix = {}
+    for (name, frames) in blendshape_curves(curves, path).items():
+        first_frame = frames[0]
+        shape_mix[name] = first_frame['value'] / 100
     return shape_mix
 
-def make_unity_bone_path(armature, bone):
-    path = bone.name
-    b = bone
-    while b.parent:
-        path = f'{b.parent.name}/{path}'
-        b = b.parent
-    return f'{armature.name}/{path}'
-
-# Assumes that the root of the path is a top-level object or nearest armature
-def make_unity_object_path(obj):
-    path = obj.name
-    o = obj
-    while o.parent:
-        if o.parent_type == 'BONE':
-            parent_bone = o.parent.data.bones[o.parent_bone]
-            bone_path = make_unity_bone_path(o.parent, parent_bone)
-            path = f'{bone_path}/{path}'
-        elif o.parent.type == 'ARMATURE':
+# Converts Unity keyframes (Hermite curves with slopes per second) to Blender
+# Bezier keyframes. Returns flat co, handle_left and handle_right arrays for
+# keyframe_points.foreach_set, and a mask of keys with constant (stepped)
+# interpolation. Values are divided by scale.
+def frames_to_bezier(frames, fps, frame_offset=0, scale=100):
+    n = len(frames)
+    times = np.fromiter((f['time'] for f in frames), dtype=np.float64, count=n)
+    values = np.fromiter((f['value'] for f in frames), dtype=np.float64, count=n) / scale
+    in_slopes = np.fromiter((f.get('inSlope', 0) for f in frames), dtype=np.float64, count=n) / scale
+    out_slopes = np.fromiter((f.get('outSlope', 0) for f in frames), dtype=np.float64, count=n) / scale
+    weighted = np.fromiter((f.get('weightedMode', 0) for f in frames), dtype=np.int32, count=n)
+    in_weights = np.where(weighted & 1, [f.get('inWeight', 1 / 3) for f in frames], 1 / 3)
+    out_weights = np.where(weighted & 2, [f.get('outWeight', 1 / 3) for f in frames], 1 / 3)
+
+    # Handles extend over a fraction of the neighbouring segment; the first
+    # and last keys use the length of their only segment
+    segments = np.diff(times)
+    if n > 1:
+        before = np.concatenate((segments[:1], segments))
+        after = np.concatenate((segments, segments[-1:]))
+    else:
+        before = after = np.full(n, 1 / fps)
+
+    constant = ~np.isfinite(out_slopes)
+    in_slopes = np.where(np.isfinite(in_slopes), in_slopes, 0)
+    out_slopes = np.where(constant, 0, out_slopes)
+
+    frame_numbers = frame_offset + times * fps
+    co = np.column_stack((frame_numbers, values))
+    handle_left = np.column_stack((
+        frame_numbers - before * in_weights * fps,
+        values - in_slopes * before * in_weights))
+    handle_right = np.column_stack((
+        frame_numbers + after * out_weights * fps,
+        values + out_slopes * after * out_weights))
+    return (co.astype(np.float32).ravel(),
+            handle_left.astype(np.float32).ravel(),
+            handle_right.astype(np.float32).ravel(),
+            constant)
+
+# Binary sidecars store the float curves of a clip as flat NumPy arrays,
+# with the keys of curve i at offsets[i]:offsets[i + 1], and are much faster
+# to load than the YAML. The clip remains the source of truth: sidecars
+# record the clip's size and mtime and are ignored once stale.
+ClipArrays = namedtuple('ClipArrays', [
+    'paths', 'attributes', 'class_ids', 'offsets',
+    'times', 'values', 'in_slopes', 'out_slopes', 'in_weights', 'out_weights',
+    'tangent_modes', 'weighted_modes'])
+
+_sidecar_float_fields = {
+    'times': 'time',
+    'values': 'value',
+    'in_slopes': 'inSlope',
+    'out_slopes': 'outSlope',
+    'in_weights': 'inWeight',
+    'out_weights': 'outWeight',
+}
+
+_sidecar_int_fields = {
+    'tangent_modes': 'tangentMode',
+    'weighted_modes': 'weightedMode',
+}
+
+# In Unity's key field order
+_sidecar_frame_fields = [
+    ('time', 'times'),
+    ('value', 'values'),
+    ('inSlope', 'in_slopes'),
+    ('outSlope', 'out_slopes'),
+    ('tangentMode', 'tangent_modes'),
+    ('weightedMode', 'weighted_modes'),
+    ('inWeight', 'in_weights'),
+    ('outWeight', 'out_weights'),
+]
+
+# Hidden, so that Unity doesn't import it as an asset
+def sidecar_path(clip_path):
+    (directory, file_name) = os.path.split(clip_path)
+    return os.path.join(directory, f'.{file_name}.npz')
+
+def float_curves_to_arrays(curves, float_dtype=np.float32):
+    keys = [frame for c in curves for frame in c.frames]
+    offsets = np.zeros(len(curves) + 1, dtype=np.int64)
+    np.cumsum([len(c.frames) for c in curves], out=offsets[1:])
+    arrays = {
+        'paths': np.array([c.path for c in curves], dtype=str),
+        'attributes': np.array([c.attribute for c in curves], dtype=str),
+        'class_ids': np.array([c.class_id for c in curves], dtype=np.int32),
+        'offsets': offsets,
+    }
+    # Unity curves are single precision, so nothing is lost
+    for (name, field) in _sidecar_float_fields.items():
+        arrays[name] = np.array([k.get(field, 0) for k in keys], dtype=float_dtype)
+    for (name, field) in _sidecar_int_fields.items():
+        arrays[name] = np.array([k.get(field, 0) for k in keys], dtype=np.int32)
+    return ClipArrays(**arrays)
+
+def arrays_to_float_curves(arrays):
+    columns = [(field, getattr(arrays, name).tolist()) for (field, name) in _sidecar_frame_fields]
+    curves = []
+    for i in range(len(arrays.paths)):
+        frames = [{'serializedVersion': 3, **{field: column[k] for (field, column) in columns}}
+                  for k in range(arrays.offsets[i], arrays.offsets[i + 1])]
+        curves.append(FloatCurve(str(arrays.paths[i]), str(arrays.attributes[i]), int(arrays.class_ids[i]), frames))
+    return curves
+
+def _clip_stamp(clip_path):
+    st = os.stat(clip_path)
+    return np.array([st.st_size, st.st_mtime_ns], dtype=np.int64)
+
+def write_clip_sidecar(clip_path, curves=None):
+    stamp = _clip_stamp(clip_path)
+    if curves is None:
+        curves = read_float_curves(clip_path, all_frames=True)
+    arrays = float_curves_to_arrays(curves)
+    out_path = sidecar_path(clip_path)
+    # Not mkstemp, which would create the file without group/other permissions
+    temp_path = f'{out_path}.{os.getpid()}.tmp'
+    try:
+        with open(temp_path, 'wb') as f:
+            np.savez(f, stamp=stamp, **arrays._asdict())
+        os.replace(temp_path, out_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+    return arrays
+
+# Returns None when the sidecar is missing or stale. np.load ignores
+# mmap_mode for .npz archives, but their members are only read on access.
+def read_clip_sidecar(clip_path):
+    try:
+        with np.load(sidecar_path(clip_path)) as archive:
+            if not np.array_equal(archive['stamp'], _clip_stamp(clip_path)):
+                return None
+            return ClipArrays(**{name: archive[name] for name in ClipArrays._fields})
+    except (OSError, KeyError, ValueError, EOFError, zipfile.BadZipFile):
+        # Truncated or corrupt sidecars are stale too
+        return None
+
+def load_clip_arrays(clip_path):
+    arrays = read_clip_sidecar(clip_path)
+    if arrays is None:
+        arrays = write_clip_sidecar(clip_path)
+    return arrays
+
+def clip_arrays_to_shape_mix(arrays, path):
+    shape_mix = {}
+    for i in range(len(arrays.attributes)):
+        components = str(arrays.attributes[i]).split('.')
+        if len(components) == 2:
+            (attribute_type, attribute_name) = components
+            start = arrays.offsets[i]
+            has_frames = arrays.offsets[i + 1] > start
+            is_path_match = not path or arrays.paths[i] == path
+            if has_frames and attribute_type == 'blendShape' and is_path_match:
+                shape_mix[attribute_name] = float(arrays.values[start]) / 100
+    return shape_mix
+
+def _load_library_clip(clip_path, path, use_sidecars):
+    if use_sidecars:
+        return clip_arrays_to_shape_mix(load_clip_arrays(clip_path), path)
+    return anim_clip_to_shape_mix(clip_path, path)
+
+def find_anim_clips(directory, recursive=True):
+    clip_paths = []
+    for (dir_path, dir_names, file_names) in os.walk(directory):
+        clip_paths.extend(os.path.join(dir_path, f) for f in file_names if f.lower().endswith('.anim'))
+        if not recursive:
             break
+    return sorted(clip_paths)
+
+# Clips are named by their path relative to the directory, without extension,
+# so that clips with the same file name in different folders don't collide
+def load_shape_mix_library(directory, path=None, recursive=True, max_workers=None, use_sidecars=False):
+    clip_paths = find_anim_clips(directory, recursive)
+    max_workers = max_workers or os.cpu_count() or 1
+    if len(clip_paths) > 1 and max_workers > 1:
+        with ProcessPoolExecutor(max_workers,
+                                 initializer=_init_worker_clip_cache,
+                                 initargs=(clip_cache.directory, clip_cache.max_disk_size)) as executor:
+            chunksize = max(1, len(clip_paths) // (max_workers * 4))
+            shape_mixes = list(executor.map(_load_library_clip, clip_paths, itertools.repeat(path), itertools.repeat(use_sidecars), chunksize=chunksize))
+    else:
+        shape_mixes = [_load_library_clip(clip_path, path, use_sidecars) for clip_path in clip_paths]
+
+    library = {}
+    for (clip_path, shape_mix) in zip(clip_paths, shape_mixes):
+        (clip_name, _) = os.path.splitext(os.path.relpath(clip_path, directory))
+        library[clip_name.replace(os.sep, '/')] = shape_mix
+    return library
+
+def _summarize_clip(clip_path):
+    try:
+        curves = read_float_curves(clip_path, all_frames=True)
+    except Exception:
+        # Unreadable clips are indexed without curves, so that they are not
+        # read again until they change
+        curves = []
+    return [(c.path, c.attribute, c.class_id, len(c.frames)) for c in curves]
+
+ClipMatch = namedtuple('ClipMatch', ['clip_path', 'num_frames', 'attributes', 'paths'])
+
+# SQLite index of the float curves of every clip in a Unity project, so that
+# clips can be found by blendshape without reading them. Clips are stored by
+# their path relative to the project directory, and only clips that are new
+# or changed since the last refresh are read.
+class ClipIndex:
+    def __init__(self, directory, database_path):
+        self.directory = os.path.abspath(directory)
+        self._connection = sqlite3.connect(database_path)
+        self._connection.executescript('''
+            PRAGMA foreign_keys = ON;
+            CREATE TABLE IF NOT EXISTS clips (
+                id INTEGER PRIMARY KEY,
+                path TEXT UNIQUE NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                num_frames INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS curves (
+                clip_id INTEGER NOT NULL REFERENCES clips (id) ON DELETE CASCADE,
+                path TEXT NOT NULL,
+                attribute TEXT NOT NULL,
+                class_id INTEGER NOT NULL,
+                num_frames INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS curves_attribute ON curves (attribute);
+            CREATE INDEX IF NOT EXISTS curves_clip_id ON curves (clip_id);
+        ''')
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # Returns the numbers of clips read, removed and unchanged
+    def refresh(self, max_workers=None):
+        stamps = {}
+        for clip_path in find_anim_clips(self.directory):
+            try:
+                st = os.stat(clip_path)
+            except OSError:
+                continue
+            relative_path = os.path.relpath(clip_path, self.directory).replace(os.sep, '/')
+            stamps[relative_path] = (st.st_size, st.st_mtime_ns)
+
+        indexed = {path: (size, mtime_ns) for (path, size, mtime_ns) in self._connection.execute('SELECT path, size, mtime_ns FROM clips')}
+        removed = [path for path in indexed if path not in stamps]
+        changed = [path for (path, stamp) in stamps.items() if indexed.get(path) != stamp]
+
+        clip_paths = [os.path.join(self.directory, path) for path in changed]
+        max_workers = max_workers or os.cpu_count() or 1
+        if len(clip_paths) > 1 and max_workers > 1:
+            with ProcessPoolExecutor(max_workers) as executor:
+                summaries = executor.map(_summarize_clip, clip_paths, chunksize=max(1, len(clip_paths) // (max_workers * 4)))
+                self._update(removed, changed, stamps, summaries)
         else:
-            path = f'{o.parent.name}/{path}'
-        o = o.parent
-    return path
+            self._update(removed, changed, stamps, map(_summarize_clip, clip_paths))
+        return (len(changed), len(removed), len(stamps) - len(changed))
+
+    def _update(self, removed, changed, stamps, summaries):
+        with self._connection:
+            self._connection.executemany('DELETE FROM clips WHERE path = ?', ((path,) for path in removed + changed))
+            for (path, curves) in zip(changed, summaries):
+                (size, mtime_ns) = stamps[path]
+                num_frames = max((n for (_, _, _, n) in curves), default=0)
+                clip_id = self._connection.execute(
+                    'INSERT INTO clips (path, size, mtime_ns, num_frames) VALUES (?, ?, ?, ?)',
+                    (path, size, mtime_ns, num_frames)).lastrowid
+                self._connection.executemany(
+                    'INSERT INTO curves (clip_id, path, attribute, class_id, num_frames) VALUES (?, ?, ?, ?, ?)',
+                    ((clip_id,) + c for c in curves))
+
+    def __len__(self):
+        return self._connection.execute('SELECT COUNT(*) FROM clips').fetchone()[0]
+
+    # Finds clips with a blendshape curve whose name contains the query
+    # (ignoring case for ASCII letters), or exactly matches it. Clip paths
+    # are relative to the project directory.
+    def search_blendshape(self, query, exact=False, limit=100):
+        if exact:
+            condition = 'attribute = ?'
+            pattern = 'blendShape.' + query
+        else:
+            condition = "attribute LIKE ? ESCAPE '\\'"
+            pattern = 'blendShape.%' + re.sub(r'([%_\\])', r'\\\1', query) + '%'
+        rows = self._connection.execute(f'''
+            SELECT clips.path, clips.num_frames, curves.attribute, curves.path FROM clips
+            JOIN curves ON curves.clip_id = clips.id
+            WHERE curves.class_id = ? AND clips.id IN (
+                SELECT DISTINCT clips.id FROM clips
+                JOIN curves ON curves.clip_id = clips.id
+                WHERE class_id = ? AND {condition}
+                ORDER BY clips.path LIMIT ?)
+            AND {condition}
+            ORDER BY clips.path''', (int(UnityClassID.SKINNED_MESH_RENDERER), int(UnityClassID.SKINNED_MESH_RENDERER), pattern, limit, pattern))
+        matches = OrderedDict()
+        for (clip_path, num_frames, attribute, path) in rows:
+            match = matches.setdefault(clip_path, ClipMatch(clip_path, num_frames, [], []))
+            match.attributes.append(attribute[len('blendShape.'):])
+            if path not in match.paths:
+                match.paths.append(path)
+        return list(matches.values())
+
+default_clip_index_directory = os.path.join(user_cache_directory(), 'clip_index')
+
+# Each project directory has its own index
+def open_clip_index(directory, index_directory=None):
+    index_directory = index_directory or default_clip_index_directory
+    os.makedirs(index_directory, mode=0o700, exist_ok=True)
+    digest = hashlib.sha1(os.path.abspath(directory).encode('utf-8')).hexdigest()
+    return ClipIndex(directory, os.path.join(index_directory, digest + '.sqlite'))
+
+def _join_path(prefix, name):
+    return f'{prefix}/{name}' if prefix else name
+
+def _identity(data):
+    return data.as_pointer() if hasattr(data, 'as_pointer') else id(data)
+
+# Resolves the paths of many objects and bones with one visit per object and
+# bone: each path is built from its parent's memoized path, top-down. Cached
+# paths go stale when objects are renamed or reparented, so a resolver that
+# outlives an operator must be cleared on depsgraph updates.
+class UnityPathResolver:
+    def __init__(self):
+        self._bone_chains = {}
+        self._object_prefixes = {}
+
+    def clear(self):
+        self._bone_chains.clear()
+        self._object_prefixes.clear()
+
+    def bone_path(self, armature, bone):
+        armature_id = _identity(armature)
+        chain = []
+        b = bone
+        while b and (armature_id, b.name) not in self._bone_chains:
+            chain.append(b)
+            b = b.parent
+        for b in reversed(chain):
+            parent_chain = self._bone_chains[(armature_id, b.parent.name)] if b.parent else ''
+            self._bone_chains[(armature_id, b.name)] = _join_path(parent_chain, b.name)
+        return f'{armature.name}/{self._bone_chains[(armature_id, bone.name)]}'
+
+    # Everything before the object's own name
+    def _object_prefix(self, obj):
+        chain = []
+        o = obj
+        while o and _identity(o) not in self._object_prefixes:
+            chain.append(o)
+            o = o.parent
+        for o in reversed(chain):
+            parent = o.parent
+            if not parent:
+                prefix = ''
+            elif o.parent_type == 'BONE':
+                parent_bone = parent.data.bones[o.parent_bone]
+                prefix = _join_path(self._object_prefixes[_identity(parent)], self.bone_path(parent, parent_bone))
+            elif parent.type == 'ARMATURE':
+                prefix = ''
+            else:
+                prefix = _join_path(self._object_prefixes[_identity(parent)], parent.name)
+            self._object_prefixes[_identity(o)] = prefix
+        return self._object_prefixes[_identity(obj)]
+
+    # Assumes that the root of the path is a top-level object or nearest armature
+    def object_path(self, obj):
+        return _join_path(self._object_prefix(obj), obj.name)
+
+    def object_paths(self, objs):
+        return [self.object_path(obj) for obj in objs]
+
+# Shared by the operators, cleared by the addon on depsgraph updates
+path_resolver = UnityPathResolver()
+
+def make_unity_bone_path(armature, bone):
+    return UnityPathResolver().bone_path(armature, bone)
+
+def make_unity_object_path(obj):
+    return UnityPathResolver().object_path(obj)